@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Memory of the telemetry records waiting in the buffer, before (lists) and after (Telemetry)
+#   python -m benchmark.bench_memory --lines 200000
+#   python -m benchmark.bench_memory --sample      # lines of sample/log_sample.csv
+
+from __future__ import annotations
+import argparse
+import datetime
+import gc
+import tracemalloc
+from benchmark.sim_obc import DEFAULT_MIX, SimulatedObc
+from src.serial_reader import level_pattern, parse_block
+
+BLOCK_LINES = 1000  # Lines per read of the serial port
+
+
+def parse_block_lists(str_data: str, verbosity_level: int) -> list:
+    # The records before Telemetry: [level, datetime, [fields]], with a datetime per line as read_telemetry made them
+    return [[m.group(1), datetime.datetime.now(), [s.replace('\x00', '') for s in m.group(2).split(",") if s]]
+            for m in level_pattern(verbosity_level).finditer(str_data)]
+
+
+def make_blocks(n_lines: int, sample: bool) -> list[str]:
+    obc = SimulatedObc(None, 0, 0, DEFAULT_MIX, sample)
+    lines = [obc.next_line() for _ in range(n_lines)]
+    return ["".join(lines[i:i + BLOCK_LINES]) for i in range(0, n_lines, BLOCK_LINES)]
+
+
+def retained_bytes(blocks: list[str], parse) -> tuple[int, int]:
+    # (bytes, lines) held by the records of the parsed blocks, as the slots of the buffer hold them
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    retained = []
+    for block in blocks:
+        retained.extend(parse(block, 0))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, len(retained)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--sample', action='store_true', help='lines of sample/log_sample.csv')
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.lines, args.sample)
+    results = {
+        'list': retained_bytes(blocks, parse_block_lists),
+        'Telemetry': retained_bytes(blocks, parse_block),
+    }
+    for name, (size, n) in results.items():
+        print(f"{name:10s}: {size / n:6.1f} bytes/line  ({size / 1024 / 1024:.1f} MB for {n} lines)")
+    print(f"ratio     : {results['Telemetry'][0] / results['list'][0]:.2f}")
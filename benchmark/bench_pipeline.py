@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# End-to-end benchmark: simulated OBC -> serial port -> reader -> buffer -> console -> log file
+# Without --gui the console only fills the history; LogPrinter.print_logs and the Tk widget are not run.
+#   python -m benchmark.bench_pipeline --rate 20000 --duration 10
+#   python -m benchmark.bench_pipeline --sample --rate 0        # sample/log_sample.csv as fast as possible
+#   python -m benchmark.bench_pipeline --gui                    # render into the real LogPrinter window
+
+from __future__ import annotations
+import argparse
+import os
+import tempfile
+import time
+from benchmark.sim_obc import DEFAULT_MIX, SimulatedObc, open_port
+from src.line_store import LineStore
+from src.log_writer import LogWriter
+from src.serial_reader import MultiSerialReader
+from src.telem_buffer import TelemRingBuffer
+
+DRAIN_TIMEOUT = 5.0     # sec to wait for the lines still in flight after the OBC stopped
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None     # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if os.uname().sysname == 'Darwin' else rss / 1024
+
+
+def percentile(values: list[float], p: float) -> float:
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class HeadlessConsole():
+    # The console path without Tk: log file on the reader thread, history per frame
+    def __init__(self, buffer: TelemRingBuffer, log_src: str, max_render_lines: int):
+        self.buffer = buffer
+        self.line_store = LineStore(1000000)
+        self.max_render_lines = max_render_lines
+        self.log_writer = LogWriter(log_src)
+        self.log_writer.start()
+
+    def on_telems(self, name: str, telems: list):
+        self.log_writer.write_batch(telems)
+        self.buffer.put_batch(telems)
+
+    def frame(self) -> list:
+        telems = self.buffer.get_batch(self.max_render_lines)
+        for telem in telems:
+            self.line_store.append(telem.level, telem.timestamp, "\t".join(telem.fields))
+        self.line_store.trim()
+        return telems
+
+    def close(self):
+        self.log_writer.stop()
+
+
+class GuiConsole():
+    # The real LogPrinter window, driven like main.py does
+    def __init__(self, buffer: TelemRingBuffer, log_src: str, max_render_lines: int):
+        from src.log_printer import LogPrinter
+        self.log_printer = LogPrinter()
+        channel = self.log_printer.channel
+        channel.latest_telems = buffer
+        channel.log_src = log_src
+        channel.start_log_writer()
+        self.log_printer.max_render_lines = max_render_lines
+
+    def on_telems(self, name: str, telems: list):
+        self.log_printer.on_telems(self.log_printer.cpu, telems)
+
+    def frame(self) -> list:
+        self.log_printer.window.read(timeout=0)
+        return self.log_printer.render_telems()
+
+    def close(self):
+        self.log_printer.channel.stop_log_writer()
+        self.log_printer.window.close()
+
+
+def bench(args) -> dict:
+    port, write = open_port()
+    buffer = TelemRingBuffer(args.buffer_size, args.overflow_policy)
+    log_src = os.path.join(tempfile.mkdtemp(), 'bench.csv')
+    console = (GuiConsole if args.gui else HeadlessConsole)(buffer, log_src, args.max_render_lines)
+    reader = MultiSerialReader(console.on_telems)
+    reader.add_port('bench', port)
+    obc = SimulatedObc(write, args.rate, args.duration, args.mix, args.sample)
+
+    latencies = []
+    received = 0
+    reader.start()
+    start = time.perf_counter()
+    obc.start()
+    last_received = time.perf_counter()
+    while obc.is_alive() or time.perf_counter() - last_received < DRAIN_TIMEOUT:
+        telems = console.frame()
+        now = time.perf_counter()
+        if len(telems) > 0:
+            last_received = now
+            received += len(telems)
+            latencies.extend(now - float(telem.fields[-1][2:]) for telem in telems if telem.fields[-1].startswith('t='))
+        if not obc.is_alive() and received >= obc.sent - buffer.dropped:
+            break
+        if len(telems) == 0 and not args.gui:
+            time.sleep(0.001)   # A GUI frame waits in window.read() instead
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    console.close()
+    port.close()
+    return {
+        'sent': obc.sent,
+        'received': received,
+        'dropped': obc.sent - received,
+        'dropped_buffer': buffer.dropped,
+        'lines_per_s': received / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'rss_mb': peak_rss_mb(),
+        'log_bytes': os.path.getsize(log_src) if os.path.exists(log_src) else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=20000, help='lines/s, 0: as fast as possible')
+    parser.add_argument('--duration', type=float, default=10, help='sec')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weights of the levels and TQDM lines')
+    parser.add_argument('--sample', action='store_true', help='send the lines of sample/log_sample.csv')
+    parser.add_argument('--gui', action='store_true', help='render into the LogPrinter window')
+    parser.add_argument('--buffer-size', type=int, default=100000)
+    parser.add_argument('--overflow-policy', default='drop_debug')
+    parser.add_argument('--max-render-lines', type=int, default=2000)
+    args = parser.parse_args()
+
+    result = bench(args)
+    rss = f"{result['rss_mb']:.1f} MB" if result['rss_mb'] is not None else 'n/a'
+    print(f"console   : {'LogPrinter window' if args.gui else 'headless, history only (no print_logs / Tk rendering, see --gui)'}")
+    print(f"sent      : {result['sent']} lines")
+    print(f"received  : {result['received']} lines ({result['lines_per_s']:.0f} lines/s)")
+    print(f"dropped   : {result['dropped']} lines ({result['dropped_buffer']} by the buffer)")
+    print(f"latency   : p50 {result['p50_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms")
+    print(f"peak RSS  : {rss}")
+    print(f"log file  : {result['log_bytes']} bytes")
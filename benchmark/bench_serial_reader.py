@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Compare the readline() reader with the chunked reader over pyserial's loop:// port
+#   python -m benchmark.bench_serial_reader --lines 20000
+
+from __future__ import annotations
+import argparse
+import threading
+import time
+import serial
+from src.serial_reader import SerialReader
+
+SAMPLE_LOG_SRC = "sample/log_sample.csv"
+
+
+def load_payload(n_lines: int) -> bytes:
+    # "timestamp,LEVEL,fields..." -> "LEVEL,fields...\n" as the OBC sends it
+    with open(SAMPLE_LOG_SRC, 'r') as f:
+        lines = [line.rstrip('\n').split(',', 1)[1] + '\n' for line in f if line.count(',') >= 2]
+    lines = (lines * (n_lines // len(lines) + 1))[:n_lines]
+    return "".join(lines).encode()
+
+
+def bench(mode: str, payload: bytes, n_lines: int) -> float:
+    # loop:// only buffers a few KB, so the payload is written from another thread like the OBC would
+    port = serial.serial_for_url('loop://', timeout=1)
+    writer = threading.Thread(target=port.write, args=(payload,), daemon=True)
+    reader = SerialReader(port, mode)
+    read_lines = 0
+    start = time.perf_counter()
+    writer.start()
+    while read_lines < n_lines:
+        read_lines += len(reader.read())
+    elapsed = time.perf_counter() - start
+    writer.join()
+    port.close()
+    return n_lines / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000)
+    args = parser.parse_args()
+
+    payload = load_payload(args.lines)
+    for mode in ['line', 'chunked']:
+        print(f"{mode:8s}: {bench(mode, payload, args.lines):10.0f} lines/s")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Startup and CPU switching time of the GUI (needs a display)
+#   python -m benchmark.bench_startup
+#   python -m benchmark.bench_startup --history 100000 --switches 30
+
+from __future__ import annotations
+import time
+start = time.perf_counter()
+
+import argparse
+from src.log_printer import LogPrinter
+from src.telemetry import Telemetry
+
+imported = time.perf_counter()
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def fill_history(log_printer: LogPrinter, n_lines: int):
+    # History of every CPU, so a switch has a full console to show
+    now = time.time()
+    for cpu, channel in log_printer.channels.items():
+        telems = [Telemetry(i % 5, now, (cpu.split()[0].upper(), f"seq={i}", "Check receiving uplink command")) for i in range(n_lines)]
+        log_printer.print_logs(telems, channel)
+        channel.line_store.trim()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', type=int, default=10000, help='lines kept by every CPU')
+    parser.add_argument('--switches', type=int, default=30)
+    args = parser.parse_args()
+
+    log_printer = LogPrinter()
+    log_printer.window.read(timeout=0)
+    started = time.perf_counter()
+
+    fill_history(log_printer, args.history)
+    cpus = list(log_printer.channels.keys())
+    switch_times = []
+    for i in range(args.switches):
+        t = time.perf_counter()
+        log_printer.change_theme(cpus[(i + 1) % len(cpus)])
+        log_printer.window.read(timeout=0)
+        switch_times.append(time.perf_counter() - t)
+    log_printer.window.close()
+
+    print(f"import    : {(imported - start) * 1000:7.1f} ms")
+    print(f"window    : {(started - imported) * 1000:7.1f} ms")
+    print(f"startup   : {(started - start) * 1000:7.1f} ms (without the interpreter)")
+    print(f"switch    : p50 {percentile(switch_times, 50) * 1000:.1f} ms  max {max(switch_times) * 1000:.1f} ms "
+          f"({args.history} lines of history, {log_printer.max_console_lines} in the console)")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Simulated OBC: writes debug lines to a serial port at a set rate
+
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+import serial
+
+SAMPLE_LOG_SRC = "sample/log_sample.csv"
+DEFAULT_MIX = "DEBUG=50,INFO=30,WARN=10,ERROR=4,FATAL=1,TQDM=5"
+SEND_INTERVAL = 0.01    # sec between bursts
+TQDM_STEPS = 100
+
+
+def parse_mix(mix: str) -> dict:
+    # "DEBUG=50,INFO=30,TQDM=5" -> {'DEBUG': 50, 'INFO': 30, 'TQDM': 5}
+    weights = {}
+    for item in mix.split(','):
+        kind, weight = item.split('=')
+        weights[kind.strip().upper()] = float(weight)
+    return weights
+
+
+def load_sample_lines() -> list[str]:
+    # "timestamp,LEVEL,fields..." -> "LEVEL,fields..." as the OBC sends it
+    with open(SAMPLE_LOG_SRC, 'r') as f:
+        return [line.rstrip('\n').split(',', 1)[1] for line in f if line.count(',') >= 2]
+
+
+def open_port():
+    # (serial port read by the console, function writing to the other end)
+    # A pty behaves like a real driver; loop:// is used where there are no ptys (Windows)
+    try:
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        port = serial.Serial(os.ttyname(slave), 921600)
+        return port, lambda data: os.write(master, data)
+    except ImportError:
+        port = serial.serial_for_url('loop://', timeout=1)
+        return port, port.write
+
+
+class SimulatedObc(threading.Thread):
+    # Every line ends with the time it was sent (time.perf_counter()), so the reader can measure latency
+    def __init__(self, write, rate: float, duration: float, mix: str = DEFAULT_MIX, sample: bool = False):
+        super().__init__(daemon=True)
+        self.write = write
+        self.rate = rate    # lines/s, 0: as fast as the port takes them
+        self.duration = duration
+        self.weights = parse_mix(mix)
+        self.sample_lines = load_sample_lines() if sample else None
+        self.sent = 0
+        self.tqdm_step = 0
+        self.random = random.Random(0)
+
+    def run(self):
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.duration:
+            if self.rate > 0:
+                n = int((time.perf_counter() - start) * self.rate) - self.sent
+                if n <= 0:
+                    time.sleep(SEND_INTERVAL)
+                    continue
+            else:
+                n = 1000
+            self.write("".join(self.next_line() for _ in range(n)).encode())
+
+    def next_line(self) -> str:
+        self.sent += 1
+        stamp = f"t={time.perf_counter():.6f}"
+        if self.sample_lines is not None:
+            return f"{self.sample_lines[self.sent % len(self.sample_lines)]},{stamp}\n"
+        kind = self.random.choices(list(self.weights.keys()), list(self.weights.values()))[0]
+        if kind == 'TQDM':
+            self.tqdm_step = (self.tqdm_step + 1) % (TQDM_STEPS + 1)
+            return f"INFO,TQDM,Downlink,MSG,{self.tqdm_step},{TQDM_STEPS},{stamp}\n"
+        return f"{kind},BENCH,seq={self.sent},value={self.random.random():.4f},{stamp}\n"
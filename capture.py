@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Headless capture: serial port -> CSV log without the GUI
+#   python capture.py --cpu Main --port COM3 --baudrate 921600
+
+from __future__ import annotations
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+import serial
+from src.cpu_channel import cpu_log_src, cpus
+from src.log_writer import LogWriter
+from src.remote import TelemServer
+from src.serial_reader import SerialReader, reader_modes, verbosity_levels
+
+READ_TIMEOUT = 0.5  # sec, how often an idle port checks for Ctrl-C
+
+
+def cpu_name(name: str) -> str:
+    # "Main" -> "Main CPU"
+    if name in cpus:
+        return name
+    if f"{name} CPU" in cpus:
+        return f"{name} CPU"
+    raise argparse.ArgumentTypeError(f"invalid CPU: {name} (choose from {', '.join(cpus)})")
+
+
+def print_stats(cpu: str, reader: SerialReader, writer: LogWriter, n_lines: int, prev: tuple):
+    now = time.monotonic()
+    elapsed = max(now - prev[0], 1e-9)
+    line_rate = (n_lines - prev[1]) / elapsed
+    byte_rate = (reader.read_bytes - prev[2]) / elapsed
+    print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {cpu}: {line_rate:8.0f} lines/s {byte_rate / 1024:8.1f} KiB/s"
+          f"  total {n_lines} lines  queued {writer.queue.qsize()}", flush=True)
+    return now, n_lines, reader.read_bytes
+
+
+def capture(args):
+    try:
+        serial_port = serial.serial_for_url(args.port, args.baudrate, timeout=READ_TIMEOUT)
+    except (serial.SerialException, ValueError) as e:
+        logging.error(f'{datetime.datetime.now()}:capture:{args.cpu}:{e}')
+        print(f"{args.cpu}: cannot open {args.port}: {e}", file=sys.stderr, flush=True)
+        sys.exit(1)
+    reader = SerialReader(serial_port, args.reader_mode, args.read_chunk_size, not args.no_interpolation)
+    reader.verbosity_level = verbosity_levels[args.level]
+    writer = LogWriter(
+        args.log_src,
+        cpu=args.cpu,
+        flush_interval=args.flush_interval,
+        rotate_size=int(args.rotate_size_mb * 1024 * 1024),
+        rotate_interval=args.rotate_interval_min * 60,
+        binary_log=args.binary_log,
+    )
+    writer.start()
+    server = None
+    if args.share_port > 0:
+        server = TelemServer(args.share_host, args.share_port)
+        server.start()
+    print(f"{args.cpu}: {args.port} {args.baudrate} baud -> {args.log_src} (Ctrl-C to stop)", flush=True)
+    if server is not None:
+        print(f"{args.cpu}: sharing on {args.share_host}:{server.port}", flush=True)
+    n_lines = 0
+    stats = (time.monotonic(), 0, 0)
+    try:
+        while True:
+            telems = reader.read()
+            if len(telems) > 0:
+                writer.write_batch(telems)
+                if server is not None:
+                    server.publish(args.cpu, telems)
+                n_lines += len(telems)
+            if args.stats_interval > 0 and time.monotonic() - stats[0] >= args.stats_interval:
+                stats = print_stats(args.cpu, reader, writer, n_lines, stats)
+    except KeyboardInterrupt:
+        pass
+    except serial.SerialException as e:
+        logging.error(f'{datetime.datetime.now()}:capture:{args.cpu}:{e}')
+        print(f"{args.cpu}: {e}", flush=True)
+    finally:
+        serial_port.close()
+        writer.stop()
+        if server is not None:
+            server.stop()
+        print(f"{args.cpu}: {n_lines} lines saved to {args.log_src}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Capture the debug log of an OBC without the GUI')
+    parser.add_argument('--cpu', type=cpu_name, default=cpus[0], help='Main, Transmit or Receive')
+    parser.add_argument('--port', required=True, help='e.g. COM3, /dev/ttyUSB0 or a pyserial URL')
+    parser.add_argument('--baudrate', type=int, default=921600)
+    parser.add_argument('--log', dest='log_src', default=None, help='log file (default: the log file of the CPU)')
+    parser.add_argument('--level', choices=[k for k in verbosity_levels if k != 'NONE'], default='DEBUG', help='lowest level saved')
+    parser.add_argument('--reader-mode', choices=reader_modes, default='chunked')
+    parser.add_argument('--read-chunk-size', type=int, default=65536)
+    parser.add_argument('--no-interpolation', action='store_true', help='stamp the lines of a read with the read time (USB-CDC ports)')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='sec')
+    parser.add_argument('--rotate-size-mb', type=float, default=0)
+    parser.add_argument('--rotate-interval-min', type=float, default=0)
+    parser.add_argument('--binary-log', action='store_true', help='also write the .odcb binary log')
+    parser.add_argument('--share-port', type=int, default=0, help='share the telemetries with other consoles on this TCP port, 0: off')
+    parser.add_argument('--share-host', default='0.0.0.0')
+    parser.add_argument('--stats-interval', type=float, default=5.0, help='sec, 0: no stats')
+    args = parser.parse_args()
+    if args.log_src is None:
+        args.log_src = cpu_log_src[args.cpu]
+
+    os.makedirs('./log', exist_ok=True)
+    logging.basicConfig(filename='./log/odc_system.log', level=logging.DEBUG)
+    capture(args)
@@ -5,4 +5,8 @@ pyinstaller -wF main.py --onefile --noconsole --icon="./img/icon.ico"
 
 copy dist\main.exe obc-debug-console.exe
 
+pyinstaller -F capture.py --onefile --icon="./img/icon.ico"
+
+copy dist\capture.exe obc-capture.exe
+
 paused
\ No newline at end of file
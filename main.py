@@ -1,36 +1,49 @@
+import multiprocessing
+import re
 import PySimpleGUI as sg
-from src.log_printer import ConfigWindow, LogPrinter, FindWindow, listup_serial_ports
+from src.log_printer import PORTS_EVENT, ConfigWindow, LogPrinter, FindWindow, ReplayWindow
+from src.replay import REPLAY_SPEEDS
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()    # The 'process' reader mode in the exe built by PyInstaller
     log_printer = LogPrinter()
     config_window = None
     find_window = None
+    replay_window = None
     cnt = 0
     max_cnt = 100
 
     while True:
-        main_evt, main_vals = log_printer.window.read(timeout=1)
+        # Blocks until an event of any window, new telemetries (TELEM_EVENT) or the timeout
+        window, evt, vals = sg.read_all_windows(timeout=log_printer.frame_timeout(find_window is not None))
+        main_evt, main_vals = (evt, vals) if window is log_printer.window else (sg.TIMEOUT_KEY, None)
 
         # if main_evt != "__TIMEOUT__":
         #     print(main_evt)
         if main_evt == sg.WIN_CLOSED or main_evt == 'Exit':
             break
         elif 'open_close' == main_evt or 'open_close_key' == main_evt:   # Open serial port
-            if log_printer.is_serial_opened:
+            if log_printer.is_serial_opened or log_printer.channel.remote is not None:
                 log_printer.stop_reading_log()
             else:
                 log_printer.start_reading_log()
         elif 'close' == main_evt or 'close_key' == main_evt:  # Close serial port
             log_printer.stop_reading_log()
+        elif 'open_all' == main_evt:  # Open the serial ports of every CPU
+            if any(channel.is_serial_opened or channel.remote is not None for channel in log_printer.channels.values()):
+                log_printer.stop_reading_all()
+            else:
+                log_printer.start_reading_all()
         elif 'refresh' == main_evt or 'refresh_key' == main_evt:
             log_printer.refresh_serial_ports()
         elif 'Clear' == main_evt:  # Clear log window
             log_printer.clear_console()
         elif 'Copy' == main_evt:   # Copy log window
             log_printer.copy_console()
+        elif main_evt == PORTS_EVENT:  # Serial ports listed by refresh_serial_ports()
+            log_printer.update_serial_ports(main_vals[PORTS_EVENT])
         elif main_evt == 'port':   # Select serial port
-            ports = listup_serial_ports()
-            log_printer.port = list(ports.keys())[list(ports.values()).index(main_vals['port'])]
+            log_printer.select_port(main_vals['port'])
         elif main_evt == 'baudrate':   # Set serial baudrate
             log_printer.baudrate = main_vals['baudrate']
         elif main_evt == 'level':  # Change verbosity level
@@ -43,12 +56,41 @@ if __name__ == "__main__":
                 log_printer.autoscroll = not main_vals['autoscroll']
             else:
                 log_printer.autoscroll = main_vals['autoscroll']
+        elif main_evt == 'profile':    # Measure the pipeline stages
+            log_printer.set_profiling(main_vals['profile'])
+        elif main_evt == 'subsystems':     # Show the rates by subsystem
+            log_printer.set_subsystems_panel(main_vals['subsystems'])
         elif main_evt == 'cpu':    # Select CPU (Change theme)
             log_printer.change_theme(main_vals['cpu'])
         elif main_evt == 'select-Main' or main_evt == 'select-Transmit' or main_evt == 'select-Receive':
             log_printer.change_theme(f"{main_evt[7:]} CPU")
         elif main_evt == 'Configure':  # Open configuration window
             config_window = ConfigWindow(log_printer)
+        elif main_evt == 'Replay':  # Replay a recorded log file
+            if log_printer.is_serial_opened:
+                sg.popup('Close the serial port before replaying a log', title='Warning', keep_on_top=True)
+                continue
+            log_src = sg.popup_get_file('Log file to replay', title='Replay', file_types=(('CSV', '*.csv'), ('ALL Files', '*.*')), initial_folder='./log', keep_on_top=True)
+            if log_src:
+                if replay_window:
+                    log_printer.stop_replay(replay_window.replay)
+                    replay_window.window.close()
+                    replay_window = None
+                try:
+                    replay_window = ReplayWindow(log_printer.start_replay(log_src))
+                except (OSError, ValueError) as e:
+                    sg.popup(f'{e}', title='Failed to open log file', keep_on_top=True)
+        elif main_evt == 'Remote':  # View the telemetries captured by another console
+            if log_printer.is_serial_opened:
+                sg.popup('Close the serial port before connecting to another console', title='Warning', keep_on_top=True)
+                continue
+            address = sg.popup_get_text('Address of the capturing console (host:port)', title='Remote', default_text=log_printer.remote_address, keep_on_top=True)
+            if address:
+                if replay_window:
+                    log_printer.stop_replay(replay_window.replay)
+                    replay_window.window.close()
+                    replay_window = None
+                log_printer.start_remote(address)
         elif main_evt == 'find':
             find_window = FindWindow()
         elif main_evt == 'up-verbosity-level' or main_evt == 'down-verbosity-level':
@@ -57,36 +99,47 @@ if __name__ == "__main__":
             log_printer.open_new_console()
 
         # Print telemetry
-        if len(log_printer.latest_telems) > 0:
-            log_printer.print_log(*log_printer.latest_telems[0])
-            log_printer.save_log(*log_printer.latest_telems[0])
-            log_printer.latest_telems.pop(0)
+        log_printer.render_telems()
+        log_printer.drain_background_channels()
+        log_printer.check_remote_sources()
 
         # Configuration
         if config_window:
-            config_evt, config_vals = config_window.window.read(timeout=1)
+            config_evt, config_vals = (evt, vals) if window is config_window.window else (sg.TIMEOUT_KEY, None)
             if config_evt == sg.WIN_CLOSED or config_evt == 'Exit' or config_evt == 'cancel':
                 config_window.window.close()
                 config_window = None
             elif config_evt == 'ok':
-                log_printer.configure_console(config_vals['console_font_size'], config_vals['tab_len'], config_vals['max_console_lines'])
+                log_printer.configure_console(config_vals['console_font_size'], config_vals['tab_len'], config_vals['max_console_lines'],
+                                              config_vals['telem_buffer_size'], config_vals['overflow_policy'],
+                                              config_vals['max_history_lines'], config_vals['virtual_console'], config_vals['binary_log'])
                 config_window.window.close()
                 config_window = None
 
+        if replay_window:
+            replay_evt, replay_vals = (evt, vals) if window is replay_window.window else (sg.TIMEOUT_KEY, None)
+            # The replay is also stopped when the serial port of the CPU is opened
+            if replay_evt == sg.WIN_CLOSED or replay_evt == 'cancel' or not replay_window.replay.running:
+                log_printer.stop_replay(replay_window.replay)
+                replay_window.window.close()
+                replay_window = None
+            else:
+                if replay_evt == 'seek':
+                    log_printer.seek_replay(replay_window.replay, replay_window.replay.first_timestamp + replay_vals['seek'])
+                elif replay_evt == 'speed':
+                    replay_window.replay.set_speed(REPLAY_SPEEDS[replay_vals['speed']])
+                elif replay_evt == 'pause':
+                    replay_window.replay.pause(not replay_window.replay.paused)
+                    replay_window.window['pause'].update(text='Play' if replay_window.replay.paused else 'Pause')
+                replay_window.update_position()
+
         if find_window:
-            find_evt, find_vals = find_window.window.read(timeout=1)
-            if find_evt == '__TIMEOUT__':
-                continue
+            find_evt, find_vals = (evt, vals) if window is find_window.window else (sg.TIMEOUT_KEY, None)
             if find_evt == sg.WIN_CLOSED or find_evt == 'Exit' or find_evt == 'cancel' or find_evt is None:
-                if find_window.highlight_idx > 0 and len(find_window.found_txt_idxes) > find_window.highlight_idx:
-                    c, r = find_window.found_txt_idxes[find_window.highlight_idx]
-                    log_printer.remove_tag_from_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'HIGHLIGHT')
-
-                for c, r in find_window.found_txt_idxes:
-                    log_printer.remove_tag_from_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'CANDIDATE')
-
+                log_printer.clear_find_tags()
                 find_window.window.close()
                 find_window = None
+                continue
             elif find_evt == 'previous' or find_evt == 'next' or find_evt == 'Find_Enter':
                 if find_evt == 'Find_Enter':
                     find_evt = find_window.last_pressed_btn
@@ -94,71 +147,32 @@ if __name__ == "__main__":
                 if len(find_vals['Find']) == 0:
                     sg.popup('Please enter text to find', title='Warning', keep_on_top=True)
                     continue
-
-                if find_window.highlight_idx >= 0 and len(find_window.found_txt_idxes) > find_window.highlight_idx:
-                    c, r = find_window.found_txt_idxes[find_window.highlight_idx]
-                    log_printer.remove_tag_from_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'HIGHLIGHT')
-
-                # Remove highlight tag from previous search result
-                if find_window.serach_txt != find_vals['Find']:
-                    for c, r in find_window.found_txt_idxes:
-                        log_printer.remove_tag_from_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'CANDIDATE')
-                        find_window.found_txt_idxes = []
-                    if find_evt == 'previous':
-                        find_window.highlight_idx = 1e100
-                    else:
-                        find_window.highlight_idx = -1
-
-                # Find text
-                find_window.serach_txt = find_vals['Find']
-                txts = log_printer.window['console'].get().splitlines()
-                find_window.found_txt_idxes = []
-                max_x_len = 0
-                for i, txt in enumerate(txts):
-                    idx = txt.find(find_window.serach_txt)
-                    if idx != -1:
-                        find_window.found_txt_idxes.append((i, idx))
-                    max_x_len = max(max_x_len, len(txt))
-                if find_evt == 'next':
-                    find_window.highlight_idx += 1
-                elif find_evt == 'previous':
-                    find_window.highlight_idx -= 1
-                if find_window.highlight_idx >= len(find_window.found_txt_idxes):
-                    find_window.highlight_idx = 0
-                elif find_window.highlight_idx < 0:
-                    find_window.highlight_idx = len(find_window.found_txt_idxes) - 1
-
-                if len(find_window.found_txt_idxes) == 0:
-                    sg.popup('No text found', title='Warning', keep_on_top=True)
-                    find_window.window['count'].update("")
+                try:
+                    idx, n_found = log_printer.find_text(find_vals['Find'], find_vals['regex'], find_vals['ignore_case'], find_evt)
+                except re.error as e:
+                    sg.popup(f'{e}', title='Invalid regular expression', keep_on_top=True)
                     continue
+                if n_found == 0:
+                    sg.popup('No text found', title='Warning', keep_on_top=True)
 
-                find_window.window['count'].update(f"{find_window.highlight_idx+1}/{len(find_window.found_txt_idxes)}")
-
-                for c, r in find_window.found_txt_idxes:
-                    log_printer.add_tag_to_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'CANDIDATE')
-
-                c, r = find_window.found_txt_idxes[find_window.highlight_idx]
-                log_printer.add_tag_to_console(f"{c+1}.{r}", f"{c+1}.{r+len(find_window.serach_txt)}", 'HIGHLIGHT')
-                yscroll_pos = (c - 10) / len(txts)
-                if yscroll_pos < 0:
-                    yscroll_pos = 0
-                xscroll_pos = (r - 20) / max_x_len
-                if xscroll_pos < 0:
-                    xscroll_pos = 0
-                log_printer.window['console'].Widget.xview_moveto(xscroll_pos)
-                log_printer.window['console'].Widget.yview_moveto(yscroll_pos)
+            # Matches are kept up to date while telemetry keeps streaming
+            log_printer.refresh_find_tags()
+            idx, n_found = log_printer.search_index.position()
+            count_txt = f"{idx+1}/{n_found}" if n_found > 0 else ""
+            if count_txt != find_window.count_txt:
+                find_window.count_txt = count_txt
+                find_window.window['count'].update(count_txt)
 
         # if cnt < max_cnt + 1:
-        #     log_printer.latest_telems.append(["INFO", None, ["TQDM", "Test", "MSG", f"{cnt}", f"{max_cnt}"]])
+        #     log_printer.channel.latest_telems.put(Telemetry(1, time.time(), ("TQDM", "Test", "MSG", f"{cnt}", f"{max_cnt}")))
         #     cnt += 1
         #     time.sleep(0.01)
         # elif cnt == max_cnt + 1:
-        #     log_printer.latest_telems.append(["FATAL", None, ["TEST"]])
-        #     log_printer.latest_telems.append(["ERROR", None, ["TEST"]])
-        #     log_printer.latest_telems.append(["WARN", None, ["TEST"]])
-        #     log_printer.latest_telems.append(["INFO", None, ["TEST"]])
-        #     log_printer.latest_telems.append(["DEBUG", None, ["TEST"]])
+        #     log_printer.channel.latest_telems.put(Telemetry(4, time.time(), ("TEST",)))
+        #     log_printer.channel.latest_telems.put(Telemetry(3, time.time(), ("TEST",)))
+        #     log_printer.channel.latest_telems.put(Telemetry(2, time.time(), ("TEST",)))
+        #     log_printer.channel.latest_telems.put(Telemetry(1, time.time(), ("TEST",)))
+        #     log_printer.channel.latest_telems.put(Telemetry(0, time.time(), ("TEST",)))
         #     cnt = 0
         # elif cnt > max_cnt + 2:
         #     cnt = 0
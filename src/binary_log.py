@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Columnar binary log (.odcb) written next to the CSV log
+#   python -m src.binary_log convert sample/log_sample.csv
+#   python -m src.binary_log dump log/log_main_cpu.odcb --level ERROR --subsystem WAIT
+#
+# File:    FILE_MAGIC, then segments
+# Segment: SEGMENT_HEADER (magic, payload size), zlib payload, SEGMENT_FOOTER
+# Payload: n rows, subsystem table, columns (timestamp deltas, level codes, subsystem codes, body offsets), bodies
+# The subsystem table keeps the raw first fields, so the rows convert back to the CSV rows; they are
+# matched by their tag, as in the subsystem panel ("ANT_IDX=1\t..." -> ANT_IDX).
+# The footer holds the time range and the per-level counts, so a query can skip a segment without inflating it.
+
+from __future__ import annotations
+import argparse
+import datetime
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from src.replay import parse_log_line
+from src.telemetry import field_tag, level_names, verbosity_levels
+
+FILE_MAGIC = b'ODCBIN01'
+SEGMENT_HEADER = struct.Struct('<4sI')     # b'SEG1', payload size
+SEGMENT_FOOTER = struct.Struct('<4sIqq6I')  # b'SEGF', n rows, min timestamp, max timestamp, rows per level
+PAYLOAD_HEADER = struct.Struct('<II')      # n rows, size of the subsystem table
+SEGMENT_ROWS = 65536
+SEGMENT_MAX_AGE = 60.0  # sec, a segment is written at least this often while logging
+
+
+def binary_log_src(log_src: str) -> str:
+    # ./log/log_main_cpu.csv -> ./log/log_main_cpu.odcb
+    return f"{os.path.splitext(log_src)[0]}.odcb"
+
+
+def to_timestamp_us(dt_now) -> int:
+    return round(dt_now.timestamp() * 1000000) if dt_now is not None else 0
+
+
+def _le(a: array) -> bytes:
+    if sys.byteorder == 'big':
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _from_le(typecode: str, data: bytes) -> array:
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+
+class SegmentBuilder():
+    def __init__(self):
+        self.timestamps = array('q')
+        self.levels = array('B')
+        self.subsystems = array('H')
+        self.offsets = array('I', [0])
+        self.bodies = bytearray()
+        self.subsystem_codes = {}   # Interned per segment
+        self.counts = [0] * len(level_names)
+        self.created = time.monotonic()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, timestamp: int, level: int, line_data: tuple[str, ...]):
+        subsystem = line_data[0] if len(line_data) > 0 else ''
+        code = self.subsystem_codes.get(subsystem)
+        if code is None:
+            code = self.subsystem_codes[subsystem] = len(self.subsystem_codes)
+        self.timestamps.append(timestamp)
+        self.levels.append(level)
+        self.subsystems.append(code)
+        self.bodies += ','.join(line_data[1:]).encode()
+        self.offsets.append(len(self.bodies))
+        self.counts[level] += 1
+
+    def encode(self) -> bytes:
+        deltas = array('q', self.timestamps)
+        for i in range(len(deltas) - 1, 0, -1):
+            deltas[i] -= deltas[i - 1]
+        table = '\n'.join(self.subsystem_codes.keys()).encode()
+        payload = b''.join([PAYLOAD_HEADER.pack(len(self), len(table)), table, _le(deltas), _le(self.levels),
+                            _le(self.subsystems), _le(self.offsets), bytes(self.bodies)])
+        compressed = zlib.compress(payload, 6)
+        footer = SEGMENT_FOOTER.pack(b'SEGF', len(self), min(self.timestamps), max(self.timestamps), *self.counts)
+        return SEGMENT_HEADER.pack(b'SEG1', len(compressed)) + compressed + footer
+
+
+class BinaryLogWriter():
+    # Not thread safe; LogWriter calls it from its own thread
+    def __init__(self, log_src: str, segment_rows: int = SEGMENT_ROWS, segment_max_age: float = SEGMENT_MAX_AGE):
+        self.log_src = log_src
+        self.segment_rows = segment_rows
+        self.segment_max_age = segment_max_age
+        self.segment = SegmentBuilder()
+        self.file = None
+
+    def write_batch(self, telems: list):
+        for telem in telems:
+            if telem.level >= len(level_names):
+                continue
+            self.segment.add(round(telem.timestamp * 1000000), telem.level, telem.fields)
+            if len(self.segment) >= self.segment_rows:
+                self.write_segment()
+
+    def flush(self, force: bool = False):
+        if len(self.segment) > 0 and (force or time.monotonic() - self.segment.created >= self.segment_max_age):
+            self.write_segment()
+
+    def write_segment(self):
+        if self.file is None:
+            log_dir = os.path.dirname(self.log_src)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            self.file = open(self.log_src, 'ab')
+            if self.file.tell() == 0:
+                self.file.write(FILE_MAGIC)
+        self.file.write(self.segment.encode())
+        self.file.flush()
+        self.segment = SegmentBuilder()
+
+    def close(self):
+        self.flush(force=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BinaryLogReader():
+    def __init__(self, log_src: str):
+        self.log_src = log_src
+
+    def segments(self):
+        # (offset of the payload, payload size, footer) of every complete segment
+        with open(self.log_src, 'rb') as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f'{self.log_src} is not a binary log')
+            while True:
+                header = f.read(SEGMENT_HEADER.size)
+                if len(header) < SEGMENT_HEADER.size:
+                    return
+                magic, size = SEGMENT_HEADER.unpack(header)
+                if magic != b'SEG1':
+                    return
+                offset = f.tell()
+                f.seek(size, os.SEEK_CUR)
+                footer = f.read(SEGMENT_FOOTER.size)
+                if len(footer) < SEGMENT_FOOTER.size:
+                    return      # Truncated by a crash
+                magic, n, min_ts, max_ts, *counts = SEGMENT_FOOTER.unpack(footer)
+                yield offset, size, {'rows': n, 'min_ts': min_ts, 'max_ts': max_ts, 'counts': counts}
+
+    def read(self, start_us: int = None, end_us: int = None, levels: set[int] = None, subsystems: set[str] = None):
+        # Rows (timestamp in us, level, first field, body) in [start_us, end_us) whose subsystem tag is in subsystems
+        with open(self.log_src, 'rb') as f:
+            for offset, size, footer in self.segments():
+                if start_us is not None and footer['max_ts'] < start_us:
+                    continue
+                if end_us is not None and footer['min_ts'] >= end_us:
+                    continue
+                if levels is not None and not any(footer['counts'][level] > 0 for level in levels):
+                    continue
+                f.seek(offset)
+                yield from self.decode(f.read(size), start_us, end_us, levels, subsystems)
+
+    def decode(self, compressed: bytes, start_us: int, end_us: int, levels: set[int], subsystems: set[str]):
+        payload = zlib.decompress(compressed)
+        n, table_size = PAYLOAD_HEADER.unpack_from(payload)
+        pos = PAYLOAD_HEADER.size
+        names = payload[pos:pos + table_size].decode().split('\n')
+        pos += table_size
+        codes = None
+        if subsystems is not None:
+            codes = {code for code, name in enumerate(names) if field_tag(name) in subsystems}
+            if len(codes) == 0:
+                return
+        timestamps = _from_le('q', payload[pos:pos + n * 8])
+        pos += n * 8
+        level_codes = _from_le('B', payload[pos:pos + n])
+        pos += n
+        subsystem_codes = _from_le('H', payload[pos:pos + n * 2])
+        pos += n * 2
+        offsets = _from_le('I', payload[pos:pos + (n + 1) * 4])
+        bodies = payload[pos + (n + 1) * 4:]
+        timestamp = 0
+        for i in range(n):
+            timestamp += timestamps[i]
+            if start_us is not None and timestamp < start_us:
+                continue
+            if end_us is not None and timestamp >= end_us:
+                continue
+            if levels is not None and level_codes[i] not in levels:
+                continue
+            if codes is not None and subsystem_codes[i] not in codes:
+                continue
+            yield timestamp, level_names[level_codes[i]], names[subsystem_codes[i]], bodies[offsets[i]:offsets[i + 1]].decode(errors='ignore')
+
+
+def convert_csv(csv_src: str, binary_src: str, segment_rows: int = SEGMENT_ROWS) -> int:
+    writer = BinaryLogWriter(binary_src, segment_rows)
+    n_rows = 0
+    batch = []
+    with open(csv_src, 'r', errors='ignore') as f:
+        for line in f:
+            telem = parse_log_line(line)
+            if telem is None:
+                continue
+            batch.append(telem)
+            if len(batch) >= 4096:
+                writer.write_batch(batch)
+                n_rows += len(batch)
+                batch = []
+    writer.write_batch(batch)
+    n_rows += len(batch)
+    writer.close()
+    return n_rows
+
+
+def format_row(row: tuple) -> str:
+    # Same as a row of the CSV log
+    timestamp, level, subsystem, body = row
+    dt_now = datetime.datetime.fromtimestamp(timestamp / 1000000)
+    return f"{dt_now},{level},{subsystem},{body}" if body else f"{dt_now},{level},{subsystem}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Binary log tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='convert CSV logs to binary logs')
+    convert.add_argument('csv', nargs='+')
+    convert.add_argument('--segment-rows', type=int, default=SEGMENT_ROWS)
+    dump = commands.add_parser('dump', help='print the rows of a binary log as CSV')
+    dump.add_argument('src')
+    dump.add_argument('--start', help='e.g. "2022-12-04 16:30:00"')
+    dump.add_argument('--end')
+    dump.add_argument('--level', nargs='+', choices=level_names[:-1])
+    dump.add_argument('--subsystem', nargs='+', help='tag of the first field, e.g. WAIT ANT_IDX')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for csv_src in args.csv:
+            binary_src = binary_log_src(csv_src)
+            if os.path.exists(binary_src):
+                os.remove(binary_src)
+            n_rows = convert_csv(csv_src, binary_src, args.segment_rows)
+            print(f"{csv_src} -> {binary_src}: {n_rows} rows, {os.path.getsize(csv_src)} -> {os.path.getsize(binary_src)} bytes")
+    elif args.command == 'dump':
+        start_us = to_timestamp_us(datetime.datetime.fromisoformat(args.start)) if args.start else None
+        end_us = to_timestamp_us(datetime.datetime.fromisoformat(args.end)) if args.end else None
+        levels = {verbosity_levels[level] for level in args.level} if args.level else None
+        subsystems = set(args.subsystem) if args.subsystem else None
+        for row in BinaryLogReader(args.src).read(start_us, end_us, levels, subsystems):
+            print(format_row(row))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import serial
+from src.line_store import LineStore
+from src.log_writer import LogWriter
+from src.parse_process import ParseProcess
+from src.remote import RemoteSource
+from src.replay import ReplaySource
+from src.subsystem_stats import SubsystemStats
+from src.telem_buffer import TelemRingBuffer
+
+cpus = ["Main CPU", "Transmit CPU", "Receive CPU"]
+cpu_log_src = {"Main CPU": "./log/log_main_cpu.csv", "Transmit CPU": "./log/log_trans_cpu.csv", "Receive CPU": "./log/log_rcv_cpu.csv"}
+
+
+class CpuChannel():
+    # Capture state of one CPU: serial port, pending telemetries, history and log file.
+    # It outlives the window, so the CPUs which are not displayed keep being captured.
+    def __init__(self, cpu: str, log_src: str, buffer_size: int, overflow_policy: str, max_history_lines: int, on_put=None):
+        self.cpu = cpu
+        self.on_put = on_put    # Called by the producers after putting telemetries into latest_telems
+        self.port = ''
+        self.baudrate = 9600
+        self.log_src = log_src
+        self.serial = None
+        self.parse_process = None   # ParseProcess owning the port in the 'process' reader mode
+        self.is_serial_opened = False
+        self.latest_telems = self.create_buffer(buffer_size, overflow_policy)
+        self.line_store = LineStore(max_history_lines)
+        self.stats = SubsystemStats()   # Fed by the producers with every line, including the dropped ones
+        self.log_writer = None
+        self.replay = None      # ReplaySource feeding latest_telems instead of the serial port
+        self.remote = None      # RemoteSource, the telemetries captured by another console
+        self.bars = {}          # Progress bar name -> line number of the bar in line_store
+        self.pending_bars = {}  # Line number -> newest state of the bar, drawn once per frame
+
+    def open(self, port: str, baudrate: int, log_src: str, buffer_size: int, overflow_policy: str, **writer_kwargs):
+        # Raise serial.SerialException if the port cannot be opened
+        self.stop_replay()
+        self.stop_remote()
+        self.latest_telems = self.create_buffer(buffer_size, overflow_policy)
+        self.serial = serial.Serial(port, baudrate)
+        self.start_capture(port, baudrate, log_src, **writer_kwargs)
+
+    def open_process(self, port: str, baudrate: int, log_src: str, buffer_size: int, overflow_policy: str, on_telems, chunk_size: int,
+                     interpolate: bool, **writer_kwargs):
+        # The port is read and parsed by a child process, which calls on_telems(cpu, telems) through a drain thread.
+        # Raise serial.SerialException if the port cannot be opened
+        self.stop_replay()
+        self.stop_remote()
+        self.latest_telems = self.create_buffer(buffer_size, overflow_policy)
+        self.start_capture(port, baudrate, log_src, **writer_kwargs)    # The child sends its first batches right away
+        try:
+            self.parse_process = ParseProcess(self.cpu, port, baudrate, on_telems, chunk_size, interpolate=interpolate,
+                                              on_dropped=lambda cpu, n: self.latest_telems.count_dropped(n))
+        except serial.SerialException:
+            self.is_serial_opened = False
+            self.stop_log_writer()
+            raise
+
+    def start_capture(self, port: str, baudrate: int, log_src: str, **writer_kwargs):
+        # Before the reader starts: the producers count and log the lines from the first one
+        self.stats.reset()
+        self.port = port
+        self.baudrate = baudrate
+        self.log_src = log_src
+        self.is_serial_opened = True
+        self.start_log_writer(**writer_kwargs)
+
+    def close(self):
+        self.is_serial_opened = False
+        self.latest_telems.close()  # First, so a reader blocked on a full 'block' buffer can finish
+        if self.parse_process is not None:
+            self.parse_process.stop()
+            self.parse_process = None
+        self.serial.close() if self.serial is not None else None
+        self.serial = None
+        self.stop_log_writer()
+
+    def reset_bars(self):
+        self.bars = {}
+        self.pending_bars = {}
+
+    def create_buffer(self, buffer_size: int, overflow_policy: str) -> TelemRingBuffer:
+        buffer = TelemRingBuffer(buffer_size, overflow_policy)
+        buffer.on_put = self.on_put
+        return buffer
+
+    def start_replay(self, log_src: str, buffer_size: int, overflow_policy: str):
+        # Raise OSError or ValueError (empty file) if the log cannot be replayed
+        self.stop_replay()
+        self.stop_remote()
+        self.latest_telems = self.create_buffer(buffer_size, overflow_policy)
+        self.stats.reset()
+        self.replay = ReplaySource(log_src, self.latest_telems, on_telems=self.stats.add_batch)
+        self.replay.start()
+
+    def stop_replay(self):
+        if self.replay is not None:
+            self.replay.stop()
+            self.replay = None
+
+    def start_remote(self, address: str, buffer_size: int, overflow_policy: str):
+        # Raise OSError or ValueError if the capturing console cannot be reached
+        self.stop_replay()
+        self.stop_remote()
+        self.latest_telems = self.create_buffer(buffer_size, overflow_policy)
+        self.remote = RemoteSource(address, self.cpu, self.latest_telems, on_telems=self.stats.add_batch)
+        self.stats.reset()
+        self.remote.start()
+
+    def stop_remote(self):
+        if self.remote is not None:
+            self.remote.stop()
+            self.remote = None
+
+    def start_log_writer(self, **writer_kwargs):
+        self.stop_log_writer()
+        self.log_writer = LogWriter(self.log_src, cpu=self.cpu, **writer_kwargs)
+        self.log_writer.start()
+
+    def stop_log_writer(self):
+        if self.log_writer is not None:
+            self.log_writer.stop()
+            self.log_writer = None
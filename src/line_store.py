@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import bisect
+from array import array
+
+COMPACT_MIN_LINES = 65536   # Trimmed slots are released once there are this many of them
+N_LEVELS = 6    # DEBUG, INFO, WARN, ERROR, FATAL, NONE
+
+
+class LineStore():
+    # Console history kept in parallel arrays (level code, timestamp, displayed text).
+    # Lines are numbered from the start of the session; trimming only moves self.start and
+    # the arrays are compacted lazily, so both append and trim take amortized constant time.
+    #
+    # A view is the subsequence of lines at or above a level. Its lines are numbered by
+    # sequence numbers (the line number itself for DEBUG), which also survive trimming.
+    def __init__(self, max_lines: int):
+        self.max_lines = max_lines
+        self.levels = array('b')
+        self.timestamps = array('d')
+        self.texts = []
+        self.start = 0          # Index of the first retained line in the arrays
+        self.first_line = 0     # Line number of the first retained line
+        self.version = 0        # Incremented on every change
+        self.edits = 0          # Incremented when a line is rewritten in place
+        # level_index[v]: line numbers of the lines whose level is v or above (v >= 1)
+        self.level_index = [None] + [array('q') for _ in range(1, N_LEVELS)]
+        self.index_start = [0] * N_LEVELS   # Index of the first retained entry
+        self.index_base = [0] * N_LEVELS    # Sequence number of level_index[v][0]
+
+    def __len__(self):
+        return len(self.texts) - self.start
+
+    @property
+    def end_line(self) -> int:
+        return self.first_line + len(self)
+
+    def append(self, level: int, timestamp: float, text: str):
+        line_num = self.end_line
+        self.levels.append(level)
+        self.timestamps.append(timestamp)
+        self.texts.append(text)
+        for v in range(1, level + 1):
+            self.level_index[v].append(line_num)
+        self.version += 1
+
+    def set_line(self, line_num: int, timestamp: float, text: str):
+        # Rewrite a retained line, keeping its level (and so the views)
+        idx = line_num - self.first_line + self.start
+        self.timestamps[idx] = timestamp
+        self.texts[idx] = text
+        self.version += 1
+        self.edits += 1
+
+    def level(self, line_num: int) -> int:
+        return self.levels[line_num - self.first_line + self.start]
+
+    def text(self, line_num: int) -> str:
+        return self.texts[line_num - self.first_line + self.start]
+
+    def get_texts(self, first_line: int, last_line: int) -> list[str]:
+        # Lines in [first_line, last_line)
+        offset = self.start - self.first_line
+        return self.texts[max(first_line, self.first_line) + offset:min(last_line, self.end_line) + offset]
+
+    def get_levels(self, first_line: int, last_line: int) -> array:
+        offset = self.start - self.first_line
+        return self.levels[max(first_line, self.first_line) + offset:min(last_line, self.end_line) + offset]
+
+    def view_first(self, min_level: int) -> int:
+        if min_level == 0:
+            return self.first_line
+        return self.index_base[min_level] + self.index_start[min_level]
+
+    def view_end(self, min_level: int) -> int:
+        if min_level == 0:
+            return self.end_line
+        return self.index_base[min_level] + len(self.level_index[min_level])
+
+    def view_line_nums(self, min_level: int, first_seq: int, last_seq: int):
+        # Line numbers of the view entries in [first_seq, last_seq)
+        first_seq = max(first_seq, self.view_first(min_level))
+        last_seq = min(last_seq, self.view_end(min_level))
+        if min_level == 0:
+            return range(first_seq, max(last_seq, first_seq))
+        base = self.index_base[min_level]
+        return self.level_index[min_level][first_seq - base:last_seq - base]
+
+    def view_texts(self, min_level: int, first_seq: int, last_seq: int) -> list[str]:
+        if min_level == 0:
+            return self.get_texts(first_seq, last_seq)
+        offset = self.start - self.first_line
+        return [self.texts[line_num + offset] for line_num in self.view_line_nums(min_level, first_seq, last_seq)]
+
+    def view_levels(self, min_level: int, first_seq: int, last_seq: int):
+        if min_level == 0:
+            return self.get_levels(first_seq, last_seq)
+        offset = self.start - self.first_line
+        return [self.levels[line_num + offset] for line_num in self.view_line_nums(min_level, first_seq, last_seq)]
+
+    def view_seq(self, min_level: int, line_num: int) -> int:
+        # Sequence number of the first view entry at or after line_num
+        if min_level == 0:
+            return min(max(line_num, self.first_line), self.end_line)
+        idx = bisect.bisect_left(self.level_index[min_level], line_num, self.index_start[min_level])
+        return self.index_base[min_level] + idx
+
+    def trim(self) -> int:
+        # Drop the oldest lines over max_lines and return how many were dropped
+        n = len(self) - self.max_lines
+        if n <= 0:
+            return 0
+        self.start += n
+        self.first_line += n
+        for v in range(1, N_LEVELS):
+            self.index_start[v] = bisect.bisect_left(self.level_index[v], self.first_line, self.index_start[v])
+        self.version += 1
+        if self.start >= COMPACT_MIN_LINES and self.start * 2 >= len(self.texts):
+            del self.texts[:self.start]
+            del self.levels[:self.start]
+            del self.timestamps[:self.start]
+            self.start = 0
+            for v in range(1, N_LEVELS):
+                del self.level_index[v][:self.index_start[v]]
+                self.index_base[v] += self.index_start[v]
+                self.index_start[v] = 0
+        return n
+
+    def clear(self):
+        self.first_line = self.end_line
+        self.levels = array('b')
+        self.timestamps = array('d')
+        self.texts = []
+        self.start = 0
+        for v in range(1, N_LEVELS):
+            self.index_base[v] += len(self.level_index[v])
+            self.level_index[v] = array('q')
+            self.index_start[v] = 0
+        self.version += 1
@@ -11,8 +11,20 @@ import re
 import serial
 import subprocess
 import threading
+import time
+import tkinter.font
+import tkinter.ttk
 import PySimpleGUI as sg
 from serial.tools import list_ports
+from src.cpu_channel import CpuChannel, cpu_log_src, cpus
+from src.log_writer import format_rows
+from src.metrics import STAGES, metrics
+from src.remote import DEFAULT_SHARE_PORT, TelemServer
+from src.replay import REPLAY_SPEEDS
+from src.search_index import SearchIndex
+from src.serial_reader import MultiSerialReader, SerialReader, reader_modes
+from src.telem_buffer import OVERFLOW_POLICIES
+from src.telemetry import Telemetry, level_names, session_time, verbosity_levels
 
 os.makedirs('./log', exist_ok=True)
 logging.basicConfig(filename='./log/odc_system.log', level=logging.DEBUG)
@@ -37,10 +49,18 @@ font_style_window = 'Helvetica'
 font_style_console = 'Ubuntu Mono'
 font_style_popup = 'Helvetica'
 themes = {'Main CPU': 'Dark', 'Transmit CPU': 'DarkBlue', 'Receive CPU': 'DarkAmber'}
-verbosity_levels = {'DEBUG': 0, 'INFO': 1, 'WARN': 2, 'ERROR': 3, 'FATAL': 4, 'NONE': 5}
-cpus = ["Main CPU", "Transmit CPU", "Receive CPU"]
-cpu_log_src = {"Main CPU": "./log/log_main_cpu.csv", "Transmit CPU": "./log/log_trans_cpu.csv", "Receive CPU": "./log/log_rcv_cpu.csv"}
 baudrates = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600]
+RENDER_CHUNK_LINES = 200   # Lines drained from the buffer between budget checks
+BUFFER_STATS_INTERVAL = 0.5     # sec
+FIND_TAG_MARGIN_LINES = 50  # Lines tagged above and below the visible region
+VIEWPORT_MARGIN_LINES = 50  # Lines rendered above and below the viewport of the virtual console
+WHEEL_SCROLL_LINES = 3
+METRICS_VIEW_INTERVAL = 0.5     # sec
+SUBSYSTEMS_VIEW_INTERVAL = 1.0  # sec
+IDLE_TIMEOUT_MS = 500   # The window is also refreshed this often without new telemetries
+FIND_REFRESH_MS = 100   # Refresh interval of the find tags while the find window is open
+TELEM_EVENT = '-TELEM-'     # Written to the window by the reader threads
+PORTS_EVENT = '-PORTS-'     # Written to the window with the serial ports listed in the background
 
 default_config = {
     "Main CPU": {
@@ -58,9 +78,29 @@ default_config = {
     "tab_len": 6,
     "console_font_size": 12,
     "max_console_lines": 10000,
+    "max_render_lines": 2000,
+    "render_budget_ms": 30,
+    "telem_buffer_size": 100000,
+    "overflow_policy": "drop_debug",
+    "log_flush_interval": 1.0,
+    "log_flush_size": 65536,
+    "log_rotate_size_mb": 0,
+    "log_rotate_interval_min": 0,
+    "reader_mode": "chunked",
+    "read_chunk_size": 65536,
+    "interpolate_timestamps": True,
+    "virtual_console": False,
+    "max_history_lines": 1000000,
+    "binary_log": False,
+    "metrics_dump_interval": 0,
+    "metrics_src": "",
+    "share_port": 0,
+    "share_host": "0.0.0.0",
+    "remote_address": f"localhost:{DEFAULT_SHARE_PORT}",
 }
 
 ICON_IMG_SRC = "img/icon.png"
+_images = {}
 
 
 def listup_serial_ports():
@@ -72,9 +112,47 @@ def listup_serial_ports():
 
 
 def img_to_base64(img_src):
-    with open(img_src, "rb") as f:
-        img = f.read()
-    return base64.b64encode(img)
+    # Every window uses the icon, so it is read once
+    if img_src not in _images:
+        with open(img_src, "rb") as f:
+            _images[img_src] = base64.b64encode(f.read())
+    return _images[img_src]
+
+
+def recolor_window(window: sg.Window):
+    # Apply the current theme to the widgets of a window without rebuilding it
+    bg = sg.theme_background_color()
+    for element in window.element_list():
+        if isinstance(element, sg.Text):
+            element.update(background_color=sg.theme_text_element_background_color(), text_color=sg.theme_text_color())
+        elif isinstance(element, sg.Checkbox):
+            element.update(background_color=bg, text_color=sg.theme_text_color())
+        elif isinstance(element, sg.Input):
+            element.update(background_color=sg.theme_input_background_color(), text_color=sg.theme_input_text_color())
+        elif isinstance(element, sg.Button):
+            element.update(button_color=sg.theme_button_color())
+        elif isinstance(element, sg.Combo):
+            recolor_combo(element)
+    widgets = [window.TKroot]
+    while len(widgets) > 0:
+        widget = widgets.pop()
+        if widget.winfo_class() in ('Tk', 'Toplevel', 'Frame', 'Canvas'):
+            widget.configure(background=bg)
+        widgets.extend(widget.winfo_children())
+
+
+def recolor_combo(combo: sg.Combo):
+    # Combos are drawn by a ttk style of their own
+    fg, bg = sg.theme_input_text_color(), sg.theme_input_background_color()
+    style_name = combo.Widget.cget('style')
+    style = tkinter.ttk.Style()
+    style.configure(style_name, foreground=fg, selectbackground=fg, insertcolor=fg, selectforeground=bg, fieldbackground=bg,
+                    arrowcolor=sg.theme_button_color()[0], background=sg.theme_button_color()[1])
+    style.map(style_name, fieldbackground=[('readonly', bg)])
+    try:
+        combo.Widget.tk.eval(f'[ttk::combobox::PopdownWindow {combo.Widget}].f.l configure -foreground {fg} -background {bg} -selectforeground {bg} -selectbackground {fg}')
+    except Exception:
+        pass
 
 
 class ConfigWindow():
@@ -84,6 +162,11 @@ class ConfigWindow():
             [sg.Text('Font size')],
             [sg.Text('    Console'), sg.InputText(key='console_font_size', default_text=f'{log_printer.console_font_size}', size=(5, 1), font=(font_style_window, 12), enable_events=True)],
             [sg.Text('Scrollback'), sg.InputText(key='max_console_lines', default_text=f'{log_printer.max_console_lines}', size=(8, 1), font=(font_style_window, 12), enable_events=True), sg.Text('lines')],
+            [sg.Text('Buffer'), sg.InputText(key='telem_buffer_size', default_text=f'{log_printer.telem_buffer_size}', size=(8, 1), font=(font_style_window, 12), enable_events=True), sg.Text('lines')],
+            [sg.Text('    Overflow'), sg.Combo(OVERFLOW_POLICIES, default_value=log_printer.overflow_policy, key='overflow_policy', size=(12, 1), readonly=True)],
+            [sg.Text('History'), sg.InputText(key='max_history_lines', default_text=f'{log_printer.max_history_lines}', size=(8, 1), font=(font_style_window, 12), enable_events=True), sg.Text('lines')],
+            [sg.Checkbox('Virtual console', key='virtual_console', default=log_printer.virtual_console)],
+            [sg.Checkbox('Binary log (.odcb)', key='binary_log', default=log_printer.binary_log)],
         ]
         self.layout = [
             [sg.Column(col)],
@@ -93,42 +176,92 @@ class ConfigWindow():
         self.window.bind('<Escape>', 'cancel')
 
 
+class ReplayWindow():
+    def __init__(self, replay):
+        self.replay = replay
+        duration = max(int(replay.last_timestamp - replay.first_timestamp), 1)
+        self.layout = [
+            [sg.Text(os.path.basename(replay.log_src), font=(font_style_window, 12))],
+            [sg.Slider(range=(0, duration), default_value=0, orientation='h', size=(50, 15), key='seek', enable_events=True, disable_number_display=True)],
+            [sg.Text('', key='position', size=(32, 1)),
+             sg.Combo(list(REPLAY_SPEEDS.keys()), default_value='1x', key='speed', size=(6, 1), enable_events=True, readonly=True),
+             sg.Button('Pause', key='pause')],
+        ]
+        self.window = sg.Window('Replay', self.layout, resizable=True, finalize=True, icon=img_to_base64(ICON_IMG_SRC))
+        self.window.bind('<Escape>', 'cancel')
+        self.position_txt = ''
+
+    def update_position(self):
+        replay = self.replay
+        position = datetime.datetime.fromtimestamp(replay.position).strftime('%Y-%m-%d %H:%M:%S')
+        position_txt = f"{position} ({replay.position - replay.first_timestamp:.0f}/{replay.last_timestamp - replay.first_timestamp:.0f} s)"
+        if replay.finished:
+            position_txt += " End"
+        if position_txt != self.position_txt:
+            self.position_txt = position_txt
+            self.window['position'].update(position_txt)
+
+
 class FindWindow():
     def __init__(self):
         self.layout = [
             [sg.Input(key='Find', font=(font_style_window, 12), enable_events=True)],
-            [sg.Button('Previous', key='previous'), sg.Button('Next', key='next'), sg.Text('', key='count')],
+            [sg.Checkbox('Regex', key='regex'), sg.Checkbox('Ignore case', key='ignore_case')],
+            [sg.Button('Previous', key='previous'), sg.Button('Next', key='next'), sg.Text('', key='count', size=(15, 1))],
         ]
         self.window = sg.Window('Find', self.layout, resizable=True, finalize=True, icon=img_to_base64(ICON_IMG_SRC))
         self.window.bind('<Escape>', 'cancel')
         self.window['Find'].bind('<Return>', '_Enter')
-        self.serach_txt = ''
-        self.highlight_idx = 0
-        self.found_txt_idxes = []
+        self.count_txt = ''
         self.last_pressed_btn = 'next'
 
 
 class LogPrinter():
     def __init__(self):
         self.cpu = 'Main CPU'
-        self.serial = None
-        self.is_prev_tqdm = False
-        self.pattern_tm = re.compile(r"(DEBUG,|INFO,|WARN,|ERROR,|FATAL,)(.*)\n")
         sg.theme(themes[self.cpu])
+        self.config = None      # Contents of config.json, read once
+        self.ports = {}         # Device -> description, listed in the background by refresh_serial_ports()
+        self.show_subsystems = False
         self.create_config_file()
         config = self.load_config()
+        # Every CPU is captured in this process; the window displays the channel of self.cpu
+        self.wakeup_pending = False
+        self.channels = {cpu: CpuChannel(cpu, cpu_log_src[cpu], self.telem_buffer_size, self.overflow_policy, self.max_history_lines, on_put=self.wake)
+                         for cpu in cpus}
+        self.reader = MultiSerialReader(self.on_telems, self.read_chunk_size, interpolate=self.interpolate_timestamps)
+        self.reader.start()
+        self.server = self.start_server()
         self.create_window(config)
+        self.refresh_serial_ports()
 
     def __del__(self):
         self.window.close()
-        self.serial.close() if self.serial is not None else None
+        self.reader.stop()
+        if self.server is not None:
+            self.server.stop()
+        for channel in self.channels.values():
+            channel.close()
+            channel.stop_replay()
+            channel.stop_remote()
+
+    @property
+    def channel(self) -> CpuChannel:
+        return self.channels[self.cpu]
+
+    @property
+    def is_serial_opened(self) -> bool:
+        return self.channel.is_serial_opened
 
     def change_theme(self, cpu):
+        # Switch the displayed CPU. The widgets are kept and recolored, only the console is refilled
+        if cpu == self.cpu:
+            return
         self.cpu = cpu
         sg.theme(themes[self.cpu])
-        self.window.close()
-        config = self.load_config()
-        self.create_window(config)
+        recolor_window(self.window)
+        self.window['cpu'].update(value=cpu)
+        self.show_channel(self.load_config())
 
     def create_config_file(self):
         if not os.path.isfile("./config/config.json"):
@@ -137,8 +270,10 @@ class LogPrinter():
                 json.dump(default_config, f, indent=4)
 
     def load_config(self):
-        with open('./config/config.json', 'r') as f:
-            config = json.load(f)
+        if self.config is None:
+            with open('./config/config.json', 'r') as f:
+                self.config = json.load(f)
+        config = self.config
         if 'tab_len' in config:
             self.tab_len = config['tab_len']
         else:
@@ -151,6 +286,27 @@ class LogPrinter():
             self.max_console_lines = config['max_console_lines']
         else:
             self.max_console_lines = default_config['max_console_lines']
+        self.max_render_lines = config.get('max_render_lines', default_config['max_render_lines'])
+        self.render_budget_ms = config.get('render_budget_ms', default_config['render_budget_ms'])
+        self.telem_buffer_size = config.get('telem_buffer_size', default_config['telem_buffer_size'])
+        self.overflow_policy = config.get('overflow_policy', default_config['overflow_policy'])
+        self.log_flush_interval = config.get('log_flush_interval', default_config['log_flush_interval'])
+        self.log_flush_size = config.get('log_flush_size', default_config['log_flush_size'])
+        self.log_rotate_size_mb = config.get('log_rotate_size_mb', default_config['log_rotate_size_mb'])
+        self.log_rotate_interval_min = config.get('log_rotate_interval_min', default_config['log_rotate_interval_min'])
+        self.reader_mode = config.get('reader_mode', default_config['reader_mode'])
+        if self.reader_mode not in reader_modes + ['process']:
+            self.reader_mode = default_config['reader_mode']
+        self.read_chunk_size = config.get('read_chunk_size', default_config['read_chunk_size'])
+        self.interpolate_timestamps = config.get('interpolate_timestamps', default_config['interpolate_timestamps'])
+        self.virtual_console = config.get('virtual_console', default_config['virtual_console'])
+        self.max_history_lines = config.get('max_history_lines', default_config['max_history_lines'])
+        self.binary_log = config.get('binary_log', default_config['binary_log'])
+        self.metrics_dump_interval = config.get('metrics_dump_interval', default_config['metrics_dump_interval'])
+        self.metrics_src = config.get('metrics_src', default_config['metrics_src'])
+        self.share_port = config.get('share_port', default_config['share_port'])
+        self.share_host = config.get('share_host', default_config['share_host'])
+        self.remote_address = config.get('remote_address', default_config['remote_address'])
         self.baudrate = config[self.cpu]['baudrate']
         return config
 
@@ -162,20 +318,17 @@ class LogPrinter():
             json.dump(config, f, indent=4)
 
     def create_window(self, config: dict) -> sg.Window:
-        ports = listup_serial_ports()
-        if config[self.cpu]['port'] in list(ports.keys()):
-            self.port = config[self.cpu]['port']
-        else:
-            self.port = list(ports.keys())[0]
-        self.log_src = cpu_log_src[self.cpu]
+        self.load_channel_settings(config)
         self.verbosity_level = list(verbosity_levels.values())[0]
-        self.latest_telems = []  # バッファとして機能するようにリストにした，FIFO形式
         self.autoscroll = True
-        self.is_serial_opened = False
+        self.wakeup_pending = False
+        self.metrics_time = 0
+        self.subsystems_time = 0
+        self.metrics_dump_time = time.perf_counter()
 
         self.window = sg.Window(
             'OBC Debugger',
-            self.layouts(list(ports.values())),
+            self.layouts(list(self.ports.values())),
             icon=img_to_base64(ICON_IMG_SRC),
             resizable=True,
             use_default_focus=False,
@@ -184,27 +337,79 @@ class LogPrinter():
         self.window.force_focus()
         self.window['console'].widget.tag_config('CANDIDATE', foreground='black', background='white')
         self.window['console'].widget.tag_config('HIGHLIGHT', foreground='white', background='blue')
+        for level in level_colors:
+            self.window['console'].widget.tag_config(f'LEVEL-{level}', foreground=level_colors[level], background=level_bg_colors[level])
         self.window['console'].update(disabled=True)
         self.bind_shortcutkeys()
         sg.cprint_set_output_destination(self.window, 'console')
+        self.update_console_line_height()
+        self.show_channel(config)
+
+    def load_channel_settings(self, config: dict):
+        # Port, baudrate and log file of the displayed CPU
+        if self.channel.is_serial_opened:
+            self.port = self.channel.port
+            self.baudrate = self.channel.baudrate
+        else:
+            self.port = self.default_port(config)
+        self.log_src = self.channel.log_src
+
+    def default_port(self, config: dict) -> str:
+        if config[self.cpu]['port'] in self.ports:
+            return config[self.cpu]['port']
+        return next(iter(self.ports), '')
+
+    def show_channel(self, config: dict):
+        # Show the settings and the history of the displayed CPU in the existing widgets
+        self.load_channel_settings(config)
+        self.window['port'].update(value=self.ports.get(self.port, ''))
+        self.window['baudrate'].update(value=self.baudrate)
+        self.window['log_src'].update(value=self.log_src)
+        self.window['console'].update(value='')
+        self.lag_txt = ''
+        self.window['lag'].update('')
+        self.buffer_stats_time = 0
+        self.subsystems_time = 0
+        self.search_index = SearchIndex()
+        self.find_tags_state = None
+        self.view_top = 0   # Line number at the top of the virtual console
+        self.viewport_state = None
+        self.viewport_version = 0
+        self.update_open_state()
+        if self.virtual_console:
+            self.set_virtual_console(True)
+        elif len(self.channel.line_store) > 0:
+            self.rerender_console()
+        else:
+            # Emptied by Clear or a new source, but the line numbers go on: the next line must land at view_end
+            self.search_index.reset([], self.channel.line_store.view_end(self.verbosity_level))
 
     def layouts(self, ports):
-        ports_dict = listup_serial_ports()
-        menubar = sg.MenuBar([['File', ['Configure', 'Exit']], ['Console', ['Clear', 'Copy']]])
+        menubar = sg.MenuBar([['File', ['Replay', 'Remote', 'Configure', 'Exit']], ['Console', ['Clear', 'Copy']]])
         cpu_cmbbox = sg.Combo(cpus, default_value=self.cpu, size=(10, 1), key='cpu', font=(font_style_window, 16), enable_events=True, readonly=True)
-        port_cmbbox = sg.Combo(ports, default_value=ports_dict[self.port], key='port', size=(25, 1), enable_events=True, readonly=True)
-        baudrate_cmbbox = sg.Combo(baudrates, default_value=baudrates[0], key='baudrate', size=(15, 1), enable_events=True, readonly=True)
+        port_cmbbox = sg.Combo(ports, default_value=self.ports.get(self.port, ''), key='port', size=(25, 1), enable_events=True, readonly=True)
+        baudrate_cmbbox = sg.Combo(baudrates, default_value=self.baudrate, key='baudrate', size=(15, 1), enable_events=True, readonly=True)
         level_cmbbox = sg.Combo(list(verbosity_levels.keys()), default_value=list(verbosity_levels.keys())[0], key='level', size=(15, 1), enable_events=True, readonly=True)
         open_close_btn = sg.Button('Open', key='open_close')
+        open_all_btn = sg.Button('Open all', key='open_all')
         refresh_btn = sg.Button('Refresh', key='refresh', enable_events=True)
         log_src_txt = sg.InputText(key='log_src', default_text=self.log_src, size=(30, 1), font=(font_style_window, 12), enable_events=True)
         console_mtl = sg.Multiline(size=(80, 25), font=(font_style_console, self.console_font_size), expand_x=True, expand_y=True, key='console', background_color='#000000', horizontal_scroll=True)
         autoscroll_chkbox = sg.Checkbox('Auto scroll', key='autoscroll', default=True, enable_events=True)
+        profile_chkbox = sg.Checkbox('Profile', key='profile', default=metrics.enabled, enable_events=True)
+        subsystems_chkbox = sg.Checkbox('Subsystems', key='subsystems', default=self.show_subsystems, enable_events=True)
+        lag_txt = sg.Text('', key='lag', size=(25, 1))
+        buffer_stats_txt = sg.Text('', key='buffer_stats', size=(45, 1))
+        capturing_txt = sg.Text('', key='capturing', size=(30, 1))
+        sharing_txt = sg.Text('', key='sharing', size=(25, 1))
+        subsystems_txt = sg.Text('', key='subsystem_stats', font=(font_style_console, 10), size=(48, 24))
+        metrics_txt = sg.Text('', key='metrics', font=(font_style_console, 10), size=(80, len(STAGES)))
         layouts = [
             [menubar],
-            [cpu_cmbbox, log_src_txt, autoscroll_chkbox],
-            [port_cmbbox, baudrate_cmbbox, level_cmbbox, open_close_btn, refresh_btn],
-            [console_mtl]
+            [cpu_cmbbox, log_src_txt, autoscroll_chkbox, profile_chkbox, subsystems_chkbox, lag_txt, capturing_txt, sharing_txt],
+            [port_cmbbox, baudrate_cmbbox, level_cmbbox, open_close_btn, open_all_btn, refresh_btn, buffer_stats_txt],
+            [sg.pin(sg.Column([[metrics_txt]], key='metrics_col', visible=metrics.enabled))],
+            [console_mtl, sg.pin(sg.Column([[subsystems_txt]], key='subsystems_col', visible=self.show_subsystems))]
         ]
         return layouts
 
@@ -223,100 +428,436 @@ class LogPrinter():
         self.window.bind("<Control-f>", "find")
 
     def refresh_serial_ports(self):
+        # Listing the ports can take a while on Windows, so the result comes back as PORTS_EVENT
+        threading.Thread(target=self.list_serial_ports, daemon=True).start()
+
+    def list_serial_ports(self):
         ports = listup_serial_ports()
-        config = self.load_config()
-        if config[self.cpu]['port'] in list(ports.keys()):
-            self.port = config[self.cpu]['port']
-        else:
-            self.port = list(ports.keys())[0]
-        self.window['port'].update(values=ports, value=self.port)
+        try:
+            self.window.write_event_value(PORTS_EVENT, ports)
+        except Exception as e:
+            logging.error(f'{datetime.datetime.now()}:list_serial_ports:{e}')
+
+    def update_serial_ports(self, ports: dict):
+        self.ports = ports
+        if not self.channel.is_serial_opened:
+            self.port = self.default_port(self.config)
+        self.window['port'].update(values=list(ports.values()), value=ports.get(self.port, ''))
+
+    def select_port(self, description: str):
+        self.port = list(self.ports.keys())[list(self.ports.values()).index(description)]
 
     def start_reading_log(self):
-        if self.is_serial_opened:
+        if self.channel.is_serial_opened:
             return
-        self.is_serial_opened = True
-        self.latest_telems = []
+        self.log_src = self.window['log_src'].get()
         try:
-            self.serial = serial.Serial(self.port, self.baudrate)
-            self.update_config(**{self.cpu: {'port': self.port, 'baudrate': self.baudrate}})
-            self.window['open_close'].update(text='Close')
-            self.window['port'].update(disabled=True)
-            self.window['baudrate'].update(disabled=True)
-            self.window['log_src'].update(disabled=True)
-            self.window['cpu'].update(disabled=True)
-            self.log_src = self.window['log_src'].get()
-            self.read_telem_thread = threading.Thread(target=self.read_telemetry, daemon=True)
-            self.read_telem_thread.start()
+            self.open_channel(self.channel, self.port, self.baudrate, self.log_src)
         except serial.serialutil.SerialException as e:
-            self.serial = None
             sg.popup(f'{e}', title='Failed to open serial port', keep_on_top=True, font=(font_style_popup, 12))
             logging.error(f'{datetime.datetime.now()}:{self.cpu}:{e}')
-            self.stop_reading_log()
+        self.update_open_state()
 
     def stop_reading_log(self):
-        self.serial.close() if self.serial is not None else None
-        self.window['open_close'].update(text='Open')
-        self.window['port'].update(disabled=False)
-        self.window['baudrate'].update(disabled=False)
-        self.window['log_src'].update(disabled=False)
-        self.window['cpu'].update(disabled=False)
-        self.is_serial_opened = False
-
-    def read_telemetry(self):
-        while self.is_serial_opened:
+        self.close_channel(self.channel)
+        self.update_open_state()
+
+    def start_server(self):
+        # Share the captured telemetries with the consoles of other engineers, if share_port is set
+        if self.share_port <= 0:
+            return None
+        try:
+            server = TelemServer(self.share_host, self.share_port)
+        except OSError as e:
+            logging.error(f'{datetime.datetime.now()}:start_server:{self.share_host}:{self.share_port}:{e}')
+            return None
+        server.start()
+        return server
+
+    def start_remote(self, address: str):
+        # View the telemetries captured by another console instead of a serial port
+        self.clear_console()
+        try:
+            self.channel.start_remote(address, self.telem_buffer_size, self.overflow_policy)
+            self.update_config(remote_address=address)
+        except (OSError, ValueError) as e:
+            sg.popup(f'{e}', title='Failed to connect', keep_on_top=True, font=(font_style_popup, 12))
+            logging.error(f'{datetime.datetime.now()}:start_remote:{self.cpu}:{address}:{e}')
+        self.update_open_state()
+
+    def check_remote_sources(self):
+        # A remote source ends when the capturing console closes or the network fails
+        closed = [channel for channel in self.channels.values() if channel.remote is not None and not channel.remote.is_alive()]
+        for channel in closed:
+            channel.stop_remote()
+        if len(closed) > 0:
+            self.update_open_state()
+
+    def start_reading_all(self):
+        # Open the ports of every CPU, as configured in the per-CPU sections of the config file
+        config = self.load_config()
+        ports = self.ports
+        errors = []
+        for cpu, channel in self.channels.items():
+            if channel.is_serial_opened or channel.remote is not None:
+                continue
+            if cpu == self.cpu:
+                port, baudrate, log_src = self.port, self.baudrate, self.window['log_src'].get()
+            else:
+                port, baudrate, log_src = config[cpu]['port'], config[cpu]['baudrate'], channel.log_src
+            if port not in ports:
+                errors.append(f'{cpu}: port "{port}" is not available')
+                continue
+            if any(c.is_serial_opened and c.port == port for c in self.channels.values()):
+                errors.append(f'{cpu}: {port} is already opened')
+                continue
+            try:
+                self.open_channel(channel, port, baudrate, log_src)
+            except serial.serialutil.SerialException as e:
+                logging.error(f'{datetime.datetime.now()}:{cpu}:{e}')
+                errors.append(f'{cpu}: {e}')
+        self.log_src = self.channel.log_src
+        self.update_open_state()
+        if len(errors) > 0:
+            sg.popup("\n".join(errors), title='Failed to open serial port', keep_on_top=True, font=(font_style_popup, 12))
+
+    def stop_reading_all(self):
+        for channel in self.channels.values():
+            self.close_channel(channel)
+        self.update_open_state()
+
+    def open_channel(self, channel: CpuChannel, port: str, baudrate: int, log_src: str):
+        # Raise serial.SerialException if the port cannot be opened
+        writer_kwargs = dict(
+            flush_interval=self.log_flush_interval,
+            flush_size=self.log_flush_size,
+            rotate_size=int(self.log_rotate_size_mb * 1024 * 1024),
+            rotate_interval=self.log_rotate_interval_min * 60,
+            binary_log=self.binary_log,
+        )
+        if self.reader_mode == 'process':
+            channel.open_process(port, baudrate, log_src, self.telem_buffer_size, self.overflow_policy,
+                                 self.on_telems, self.read_chunk_size, self.interpolate_timestamps, **writer_kwargs)
+        else:
+            channel.open(port, baudrate, log_src, self.telem_buffer_size, self.overflow_policy, **writer_kwargs)
+        self.update_config(**{channel.cpu: {'port': port, 'baudrate': baudrate}})
+        if self.reader_mode == 'process':
+            return
+        elif self.reader_mode == 'line':
+            threading.Thread(target=self.read_telemetry, args=(channel,), daemon=True).start()
+        else:
+            self.reader.interpolate = self.interpolate_timestamps
+            self.reader.add_port(channel.cpu, channel.serial)
+
+    def close_channel(self, channel: CpuChannel):
+        channel.stop_remote()
+        if not channel.is_serial_opened:
+            return
+        self.reader.remove_port(channel.cpu)
+        channel.close()
+        if channel.latest_telems.enqueued > 0:
+            logging.info(f'{datetime.datetime.now()}:stop_reading_log:{channel.cpu}:{channel.latest_telems.stats()}')
+
+    def update_open_state(self):
+        opened = self.channel.is_serial_opened or self.channel.remote is not None
+        self.window['open_close'].update(text='Close' if opened else 'Open')
+        self.window['port'].update(disabled=opened)
+        self.window['baudrate'].update(disabled=opened)
+        self.window['log_src'].update(disabled=opened)
+        capturing = [cpu.split()[0] if channel.is_serial_opened else f"{cpu.split()[0]} (remote)"
+                     for cpu, channel in self.channels.items() if channel.is_serial_opened or channel.remote is not None]
+        self.window['open_all'].update(text='Close all' if len(capturing) > 0 else 'Open all')
+        self.window['capturing'].update(f"Capturing: {', '.join(capturing)}" if len(capturing) > 0 else '')
+
+    def start_replay(self, log_src: str):
+        # Raise OSError or ValueError if the log cannot be replayed
+        self.clear_console()
+        self.channel.start_replay(log_src, self.telem_buffer_size, self.overflow_policy)
+        self.update_open_state()
+        return self.channel.replay
+
+    def seek_replay(self, replay, timestamp: float):
+        # The history and the subsystem stats restart from the seek position
+        replay.seek(timestamp)
+        for channel in self.channels.values():
+            if channel.replay is replay:
+                channel.stats.reset()
+        if replay is self.channel.replay:
+            self.clear_console()
+            return
+        for channel in self.channels.values():
+            if channel.replay is replay:
+                channel.line_store.clear()
+                channel.reset_bars()
+
+    def stop_replay(self, replay):
+        for channel in self.channels.values():
+            if channel.replay is replay:
+                channel.stop_replay()
+
+    def on_telems(self, cpu: str, telems: list):
+        # Called on the reader thread. With the 'block' policy a full buffer stalls the other CPUs too
+        channel = self.channels[cpu]
+        # Logged before the buffer, so the lines it drops or which are still pending when the port is reopened are in the file
+        if channel.log_writer is not None:
+            channel.log_writer.write_batch(telems)
+        else:
+            self.save_logs(telems, channel)
+        if self.server is not None:
+            self.server.publish(cpu, telems)
+        channel.stats.add_batch(telems)
+        if not metrics.enabled:
+            channel.latest_telems.put_batch(telems)
+            return
+        start = time.perf_counter()
+        channel.latest_telems.put_batch(telems)
+        metrics.record('enqueue', time.perf_counter() - start, len(telems))
+
+    def read_telemetry(self, channel: CpuChannel):
+        # Thread per port, only used by the 'line' reader mode
+        serial_port = channel.serial
+        reader = SerialReader(serial_port, self.reader_mode, self.read_chunk_size, self.interpolate_timestamps)
+        while channel.serial is serial_port:
             try:    # 見えぬバグ ifで消した 午前2時
-                byte_data = self.serial.readline()
+                telems = reader.read()
             except serial.SerialException:  # "ReadFile failed (OSError(9, 'ハンドルが無効です。', None, 6))" will be raised when closing the serial port
-                pass
+                continue
             except AttributeError:  # "'NoneType' object has no attribute 'hEvent'" will be raised when closing the serial port
-                pass
+                continue
             except TypeError:   # "byref() argument must be a ctypes instance, not 'NoneType'" will be raised when closing the serial port
-                pass
+                continue
             except Exception as e:
-                logging.error(f'{datetime.datetime.now()}:read_telemetry:{self.cpu}:{e}')
-            str_data = byte_data.decode(errors='ignore')
-            re_result = self.pattern_tm.match(str_data)
-            if re_result:
-                level = re_result.group(1)[:-1]
-                if verbosity_levels[level] >= self.verbosity_level:
-                    dt_now = datetime.datetime.now()
-                    line_data = [f"{s}" for s in re_result.group(2).split(",") if s]
-                    line_data = [l.replace('\x00', '') for l in line_data]
-                    self.latest_telems.append([level, dt_now, line_data])
+                logging.error(f'{datetime.datetime.now()}:read_telemetry:{channel.cpu}:{e}')
+                continue
+            if len(telems) > 0:
+                self.on_telems(channel.cpu, telems)
 
     def clear_console(self):
         self.window['console'].update(value='')
+        self.search_index.clear()
+        self.channel.line_store.clear()
+        self.channel.reset_bars()
+        if self.virtual_console:
+            self.render_viewport()
 
     def copy_console(self):
         self.window['console'].Widget.clipboard_clear()
-        self.window['console'].Widget.clipboard_append(self.window['console'].get())
+        if self.virtual_console:
+            self.window['console'].Widget.clipboard_append("\n".join(self.channel.line_store.get_texts(self.channel.line_store.first_line, self.channel.line_store.end_line)))
+        else:
+            self.window['console'].Widget.clipboard_append(self.window['console'].get())
+
+    def save_log(self, telem: Telemetry):
+        self.save_logs([telem])
 
-    def save_log(self, level: str, dt_now: str, line_data: list[str]):
+    def save_logs(self, telems: list, channel: CpuChannel = None):
+        if len(telems) == 0:
+            return
+        channel = channel if channel is not None else self.channel
+        if channel.replay is not None or channel.remote is not None:
+            return  # Replayed lines are already in a log file, remote lines in the log of the capturing console
+        # Lines read while the channel has no log writer, e.g. the last read of a port being closed
         try:
-            with open(self.log_src, 'a') as f:
-                f.write(f"{dt_now},{level},{','.join(line_data)}\n")
+            with open(channel.log_src, 'a') as f:
+                f.write(format_rows(telems))
         except Exception as e:
-            logging.error(f'{datetime.datetime.now()}:save_log:{self.cpu}:{e}')
+            logging.error(f'{datetime.datetime.now()}:save_log:{channel.cpu}:{e}')
+
+    def wake(self):
+        # Called by the producer threads. Coalesced, so the window gets at most one event per frame
+        if self.wakeup_pending:
+            return
+        self.wakeup_pending = True
+        try:
+            self.window.write_event_value(TELEM_EVENT, None)
+        except Exception:
+            pass    # The window is being rebuilt; it is refreshed after IDLE_TIMEOUT_MS anyway
+
+    def frame_timeout(self, find_opened: bool = False) -> int:
+        # Timeout of the next window read in ms; 0 if the last frame could not render everything
+        if len(self.channel.latest_telems) > 0:
+            return 0
+        return FIND_REFRESH_MS if find_opened else IDLE_TIMEOUT_MS
+
+    def render_telems(self):
+        # Drain the pending telemetries within the line and time budget of one frame
+        self.wakeup_pending = False
+        start = time.perf_counter()
+        budget = self.render_budget_ms / 1000
+        rendered = []
+        while len(self.channel.latest_telems) > 0 and len(rendered) < self.max_render_lines:
+            telems = self.channel.latest_telems.get_batch(min(self.max_render_lines - len(rendered), RENDER_CHUNK_LINES))
+            if metrics.enabled and self.channel.replay is None and self.channel.remote is None:
+                metrics.record('queue', session_time() - telems[0].timestamp, len(telems))
+            self.print_logs(telems)
+            rendered.extend(telems)
+            if time.perf_counter() - start > budget:
+                break
+        if len(rendered) > 0:
+            self.update_processing_bars(self.channel)
+            self.trim_console()
+            if metrics.enabled:
+                metrics.record('render', time.perf_counter() - start, len(rendered))
+        self.update_lag_status()
+        self.update_buffer_stats()
+        self.update_metrics()
+        self.update_subsystem_stats()
+        return rendered
 
-    def print_log(self, level: str, dt_now: str, line_data: list[str]):
-        # echo_str = f"[{dt_now}] {level}\t" + "\t".join(line_data)
-        if len(line_data) > 3 and line_data[0] == "TQDM":
-            if "MSG" in line_data:
-                msg_idx = line_data.index("MSG")
+    def drain_background_channels(self):
+        # The CPUs which are not displayed only go to their history and log file
+        for channel in self.channels.values():
+            if channel is self.channel:
+                continue
+            while len(channel.latest_telems) > 0:
+                telems = channel.latest_telems.get_batch(self.max_render_lines)
+                self.print_logs(telems, channel)
+            self.update_processing_bars(channel)
+            channel.line_store.trim()
+
+    def update_lag_status(self):
+        pending = len(self.channel.latest_telems)
+        lag = None
+        oldest = self.channel.latest_telems.peek()
+        if oldest is not None and self.channel.replay is None and self.channel.remote is None:
+            # Remote lines carry the clock of the capturing PC: only the backlog is shown for them
+            lag = session_time() - oldest.timestamp
+        lag_txt = '' if pending == 0 else f"Behind: {pending} lines" if lag is None else f"Behind: {pending} lines ({lag:.1f} s)"
+        if lag_txt != self.lag_txt:
+            self.lag_txt = lag_txt
+            self.window['lag'].update(lag_txt)
+
+    def update_buffer_stats(self):
+        now = time.perf_counter()
+        if now - self.buffer_stats_time < BUFFER_STATS_INTERVAL:
+            return
+        self.buffer_stats_time = now
+        stats = self.channel.latest_telems.stats()
+        self.window['buffer_stats'].update(f"Buffer {stats['size']}/{stats['capacity']} (peak {stats['high_water']})  In {stats['enqueued']}  Dropped {stats['dropped']}")
+        if self.server is not None:
+            # Viewers connected to this console, and the ones dropped for falling behind
+            self.window['sharing'].update(f"Viewers {self.server.n_clients()}  Dropped {self.server.dropped_clients}")
+
+    def set_subsystems_panel(self, visible: bool):
+        self.show_subsystems = visible
+        self.window['subsystems_col'].update(visible=visible)
+        self.subsystems_time = 0
+
+    def update_subsystem_stats(self):
+        # Rates of the displayed CPU by subsystem; the stats are kept up to date by the producers either way
+        if not self.show_subsystems:
+            return
+        now = time.perf_counter()
+        if now - self.subsystems_time < SUBSYSTEMS_VIEW_INTERVAL:
+            return
+        self.subsystems_time = now
+        if self.channel.is_serial_opened:
+            self.channel.stats.tick(session_time())
+        self.window['subsystem_stats'].update(self.channel.stats.format())
+
+    def set_profiling(self, enabled: bool):
+        metrics.enable(enabled)
+        self.window['metrics_col'].update(visible=enabled)
+        self.metrics_dump_time = time.perf_counter()
+
+    def update_metrics(self):
+        if not metrics.enabled:
+            return
+        now = time.perf_counter()
+        if now - self.metrics_time >= METRICS_VIEW_INTERVAL:
+            self.metrics_time = now
+            self.window['metrics'].update(metrics.format())
+        if self.metrics_dump_interval > 0 and now - self.metrics_dump_time >= self.metrics_dump_interval:
+            self.metrics_dump_time = now
+            self.dump_metrics()
+
+    def dump_metrics(self):
+        summary = json.dumps(metrics.summary())
+        if not self.metrics_src:
+            logging.info(f'{datetime.datetime.now()}:metrics:{summary}')
+            return
+        try:
+            with open(self.metrics_src, 'a') as f:
+                f.write(f'{datetime.datetime.now()},{summary}\n')
+        except Exception as e:
+            logging.error(f'{datetime.datetime.now()}:dump_metrics:{e}')
+
+    def print_log(self, telem: Telemetry):
+        self.print_logs([telem])
+        self.update_processing_bars(self.channel)
+        self.trim_console()
+
+    def print_logs(self, telems: list, channel: CpuChannel = None):
+        # Consecutive lines of the same level are inserted into the console at once.
+        # The lines of the other CPUs are only added to their history.
+        channel = channel if channel is not None else self.channel
+        min_level = self.verbosity_level if channel is self.channel else len(verbosity_levels)
+        run_level = None
+        run_lines = []
+        for telem in telems:
+            level, line_data = telem.level, telem.fields
+            if len(line_data) > 3 and line_data[0] == "TQDM":
+                bar = self.parse_tqdm(level, line_data, channel)
+                if bar is None:
+                    continue
+                name, msg, step, max_step = bar
+                line_num = channel.bars.get(name)
+                if line_num is not None and line_num >= channel.line_store.first_line:
+                    # Update of a bar already in the console, drawn in place by update_processing_bars()
+                    channel.pending_bars[line_num] = (level, telem.timestamp, msg, step, max_step)
+                    if step >= max_step:
+                        del channel.bars[name]  # The next bar of the same name starts a new line
+                    continue
+                echo_str = self.format_processing_bar(msg, step, max_step)
+                if step < max_step:
+                    channel.bars[name] = channel.line_store.end_line
             else:
-                logging.warn(f'{datetime.datetime.now()}:{self.cpu}:MSG is not in line_data,{line_data}')
-                return
-            try:
-                self.print_processing_bar(level, dt_now, line_data[1:msg_idx], int(line_data[msg_idx + 1]), int(line_data[msg_idx + 2]))
-            except:
-                logging.error(f'{datetime.datetime.now()}:print_log:{self.cpu}:{line_data}')
-                return
-            self.is_prev_tqdm = True
+                echo_str = self.align_tab_string("\t".join(line_data))
+            channel.line_store.append(level, telem.timestamp, echo_str)
+            if level < min_level:
+                continue    # Kept in the history, shown when the verbosity level is lowered
+            if level != run_level:
+                self.cprint_lines(run_level, run_lines)
+                run_level = level
+                run_lines = []
+            run_lines.append(echo_str)
+        self.cprint_lines(run_level, run_lines)
+
+    def cprint_lines(self, level: int, lines: list[str]):
+        if len(lines) == 0:
+            return
+        if not self.virtual_console:
+            name = level_names[level]
+            sg.cprint("\n".join(lines), autoscroll=self.autoscroll, end='\n', text_color=level_colors[name], background_color=level_bg_colors[name])
+        self.search_index.append_lines(lines)
+
+    def parse_tqdm(self, level: int, line_data: tuple[str, ...], channel: CpuChannel):
+        # "TQDM,<name>...,MSG,<step>,<max_step>" -> (bar name, name fields, step, max_step)
+        if "MSG" in line_data:
+            msg_idx = line_data.index("MSG")
         else:
-            echo_str = "\t".join(line_data)
-            echo_str = self.align_tab_string(echo_str)
-            self.is_prev_tqdm = False
-            sg.cprint(f"{echo_str}", autoscroll=self.autoscroll, end='\n', text_color=level_colors[level], background_color=level_bg_colors[level])
+            logging.warn(f'{datetime.datetime.now()}:{channel.cpu}:MSG is not in line_data,{line_data}')
+            return None
+        try:
+            msg = line_data[1:msg_idx]
+            step = int(line_data[msg_idx + 1])
+            max_step = int(line_data[msg_idx + 2])
+        except:
+            logging.error(f'{datetime.datetime.now()}:print_log:{channel.cpu}:{line_data}')
+            return None
+        if max_step == 0:
+            logging.warn(f'{datetime.datetime.now()}:{channel.cpu}:max_step is 0:{level_names[level]}:{msg}:{step}:{max_step}')
+            return None
+        # A bar keeps its level, so a bar changing its level is another bar
+        return (level, tuple(msg)), msg, step, max_step
+
+    def trim_console(self):
+        n_trimmed = self.channel.line_store.trim()
+        if self.virtual_console:
+            if n_trimmed > 0:
+                self.search_index.trim(self.channel.line_store.view_first(self.verbosity_level) - self.search_index.first_line)
+            self.render_viewport()
+            return
 
         # If the number of lines is over self.max_console_lines, delete the first line
         over_line_num = float(self.window['console'].Widget.index('end-1c').split('.')[0]) - self.max_console_lines
@@ -324,23 +865,39 @@ class LogPrinter():
             self.window['console'].update(disabled=False)
             self.window['console'].Widget.delete(1.0, over_line_num + 1)
             self.window['console'].update(disabled=True)
+            self.search_index.trim(int(over_line_num))
         self.window['console'].Widget.tag_raise("sel")
 
-    def print_processing_bar(self, level: str, dt_now: str, msg: str, step: int, max_step: int):
+    def format_processing_bar(self, msg: list[str], step: int, max_step: int) -> str:
         echo_str = "\t".join(msg)
-        if max_step == 0:
-            logging.warn(f'{datetime.datetime.now()}:{self.cpu}:max_step is 0:{level}:{msg}:{step}:{max_step}')
-            return
         echo_str += f"\t[{step:4d} / {max_step:4d}]\t"
         echo_str += "#" * int(step / max_step * 30) + " " * (30 - int(step / max_step * 30)) + "|"
-        echo_str = self.align_tab_string(echo_str)
-        if self.is_prev_tqdm:
-            # 直前1行を削除する
-            line_num = float(self.window['console'].Widget.index('end-1c').split('.')[0])
-            self.window['console'].update(disabled=False)
-            self.window['console'].Widget.delete(line_num - 1, line_num)
-            self.window['console'].update(disabled=True)
-        sg.cprint(f"{echo_str}", autoscroll=self.autoscroll, end='\n', text_color=level_colors[level], background_color=level_bg_colors[level])
+        return self.align_tab_string(echo_str)
+
+    def update_processing_bars(self, channel: CpuChannel):
+        # Draw the newest state of every bar updated in this frame, in place
+        store = channel.line_store
+        widget = self.window['console'].Widget
+        for line_num, (level, timestamp, msg, step, max_step) in channel.pending_bars.items():
+            if line_num < store.first_line:
+                continue    # Trimmed
+            echo_str = self.format_processing_bar(msg, step, max_step)
+            store.set_line(line_num, timestamp, echo_str)
+            # The console mirrors the history of the displayed CPU filtered by the verbosity level
+            if channel is not self.channel or level < self.verbosity_level:
+                continue
+            seq = store.view_seq(self.verbosity_level, line_num)
+            self.search_index.set_line(seq, echo_str)
+            if self.virtual_console:
+                continue    # Redrawn by render_viewport()
+            widget_line = seq - self.search_index.first_line + 1
+            if widget_line < 1 or widget_line > len(self.search_index):
+                continue
+            widget.configure(state='normal')
+            widget.delete(f"{widget_line}.0", f"{widget_line}.end")
+            widget.insert(f"{widget_line}.0", echo_str, f'LEVEL-{level_names[level]}')
+            widget.configure(state='disabled')
+        channel.pending_bars = {}
 
     def add_tag_to_console(self, start_idx: tuple(int, int), end_idx: tuple(int, int), tag_name: str):
         self.window['console'].Widget.tag_add(tag_name, start_idx, end_idx)
@@ -348,10 +905,175 @@ class LogPrinter():
     def remove_tag_from_console(self, start_idx: tuple(int, int), end_idx: tuple(int, int), tag_name: str):
         self.window['console'].Widget.tag_remove(tag_name, start_idx, end_idx)
 
+    def find_text(self, text: str, regex: bool, ignore_case: bool, direction: str):
+        # Raise re.error if text is not a valid regular expression
+        self.search_index.set_query(text, regex, ignore_case)
+        if direction == 'previous':
+            match = self.search_index.find_previous()
+        else:
+            match = self.search_index.find_next()
+        if match is not None:
+            line_num, col, length = match
+            if self.virtual_console:
+                self.view_top = line_num - self.viewport_rows() // 2
+                self.render_viewport()
+            self.window['console'].Widget.see(f"{line_num - self.widget_first_line() + 1}.{col}")
+        self.find_tags_state = None
+        self.refresh_find_tags()
+        return self.search_index.position()
+
+    def refresh_find_tags(self):
+        # Tag the matches around the visible region only, and only when something changed
+        widget = self.window['console'].Widget
+        first_vis = int(widget.index('@0,0').split('.')[0])
+        last_vis = int(widget.index(f'@0,{widget.winfo_height()}').split('.')[0])
+        state = (first_vis, last_vis, self.search_index.first_line, self.search_index.n_matches, self.search_index.current)
+        if state == self.find_tags_state:
+            return
+        self.find_tags_state = state
+        widget.tag_remove('CANDIDATE', '1.0', 'end')
+        widget.tag_remove('HIGHLIGHT', '1.0', 'end')
+        offset = self.widget_first_line() - 1     # line number -> widget line
+        for line_num, col, length in self.search_index.matches_between(first_vis + offset - FIND_TAG_MARGIN_LINES, last_vis + offset + FIND_TAG_MARGIN_LINES):
+            widget.tag_add('CANDIDATE', f"{line_num - offset}.{col}", f"{line_num - offset}.{col + length}")
+        if self.search_index.current is not None:
+            line_num, col, length = self.search_index.current
+            if line_num >= self.widget_first_line():
+                widget.tag_add('HIGHLIGHT', f"{line_num - offset}.{col}", f"{line_num - offset}.{col + length}")
+        widget.tag_raise('CANDIDATE')
+        widget.tag_raise('HIGHLIGHT')
+
+    def clear_find_tags(self):
+        self.search_index.set_query('')
+        self.window['console'].Widget.tag_remove('CANDIDATE', '1.0', 'end')
+        self.window['console'].Widget.tag_remove('HIGHLIGHT', '1.0', 'end')
+        self.find_tags_state = None
+
+    def widget_first_line(self) -> int:
+        # Line number (in the numbering of self.search_index) of the first line in the console widget
+        if self.virtual_console:
+            return self.viewport_state[1] if self.viewport_state is not None else self.channel.line_store.view_first(self.verbosity_level)
+        return self.search_index.first_line
+
+    def update_console_line_height(self):
+        self.console_line_height = tkinter.font.Font(font=self.window['console'].Widget.cget('font')).metrics('linespace')
+
+    def viewport_rows(self) -> int:
+        return max(self.window['console'].Widget.winfo_height() // max(self.console_line_height, 1), 1)
+
+    def set_virtual_console(self, enabled: bool):
+        # The virtual console keeps every line in self.channel.line_store and renders only the viewport.
+        # The scrollbar and the mouse wheel are routed to the store instead of the widget.
+        self.virtual_console = enabled
+        console = self.window['console']
+        if enabled:
+            console.Widget.configure(yscrollcommand=lambda *args: None)
+            console.vsb.configure(command=self.on_console_scroll)
+            for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+                console.Widget.bind(sequence, self.on_console_wheel)
+            self.reset_search_index_to_view()
+            self.view_top = self.channel.line_store.view_end(self.verbosity_level)
+            self.viewport_state = None
+            self.render_viewport()
+        else:
+            console.Widget.configure(yscrollcommand=console.vsb.set)
+            console.vsb.configure(command=console.Widget.yview)
+            for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+                console.Widget.unbind(sequence)
+            self.rerender_console()
+        self.find_tags_state = None
+
+    def insert_view_lines(self, first_seq: int, last_seq: int):
+        # Insert the lines of the filtered history into the console with one insert call, one tag per colour run
+        args = []
+        run_level = None
+        run_lines = []
+        v = self.verbosity_level
+        for level, text in zip(self.channel.line_store.view_levels(v, first_seq, last_seq), self.channel.line_store.view_texts(v, first_seq, last_seq)):
+            if level != run_level and len(run_lines) > 0:
+                args += ["\n".join(run_lines) + "\n", f'LEVEL-{level_names[run_level]}']
+                run_lines = []
+            run_level = level
+            run_lines.append(text)
+        if len(run_lines) > 0:
+            args += ["\n".join(run_lines) + "\n", f'LEVEL-{level_names[run_level]}']
+        # Multiline.update() would scroll to the end, so the state of the widget is changed directly
+        widget = self.window['console'].Widget
+        widget.configure(state='normal')
+        widget.delete('1.0', 'end')
+        if len(args) > 0:
+            widget.insert('end', *args)
+        widget.configure(state='disabled')
+
+    def reset_search_index_to_view(self):
+        # In the virtual console the search index covers the whole filtered history
+        v = self.verbosity_level
+        first_seq = self.channel.line_store.view_first(v)
+        self.search_index.reset(self.channel.line_store.view_texts(v, first_seq, self.channel.line_store.view_end(v)), first_seq)
+
+    def rerender_console(self):
+        # Fill the normal console with the latest max_console_lines lines of the filtered history
+        v = self.verbosity_level
+        last_seq = self.channel.line_store.view_end(v)
+        first_seq = max(last_seq - self.max_console_lines + 1, self.channel.line_store.view_first(v))
+        self.insert_view_lines(first_seq, last_seq)
+        self.search_index.reset(self.channel.line_store.view_texts(v, first_seq, last_seq), first_seq)
+        if self.autoscroll:
+            self.window['console'].Widget.see('end')
+        self.find_tags_state = None
+
+    def render_viewport(self):
+        store = self.channel.line_store
+        v = self.verbosity_level
+        view_first = store.view_first(v)
+        view_end = store.view_end(v)
+        rows = self.viewport_rows()
+        if self.autoscroll and store.version != self.viewport_version:
+            self.view_top = view_end - rows
+        self.view_top = max(min(self.view_top, view_end - rows), view_first)
+        self.viewport_version = store.version
+        first_seq = max(self.view_top - VIEWPORT_MARGIN_LINES, view_first)
+        last_seq = min(self.view_top + rows + VIEWPORT_MARGIN_LINES, view_end)
+        # Progress bars are redrawn in place
+        state = (v, first_seq, last_seq, store.edits)
+        if state != self.viewport_state:
+            self.insert_view_lines(first_seq, last_seq)
+            self.viewport_state = state
+        widget = self.window['console'].Widget
+        widget.yview(f"{self.view_top - first_seq + 1}.0")
+        n_view = view_end - view_first
+        if n_view > 0:
+            self.window['console'].vsb.set((self.view_top - view_first) / n_view, min((self.view_top - view_first + rows) / n_view, 1))
+        else:
+            self.window['console'].vsb.set(0, 1)
+
+    def on_console_scroll(self, *args):
+        rows = self.viewport_rows()
+        if args[0] == 'moveto':
+            view_first = self.channel.line_store.view_first(self.verbosity_level)
+            self.view_top = view_first + int(float(args[1]) * (self.channel.line_store.view_end(self.verbosity_level) - view_first))
+        elif args[0] == 'scroll':
+            self.view_top += int(args[1]) * (rows if args[2] == 'pages' else 1)
+        self.render_viewport()
+
+    def on_console_wheel(self, event):
+        if event.num == 4:
+            self.view_top -= WHEEL_SCROLL_LINES
+        elif event.num == 5:
+            self.view_top += WHEEL_SCROLL_LINES
+        elif event.delta != 0:
+            notches = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+            self.view_top -= notches * WHEEL_SCROLL_LINES
+        self.render_viewport()
+        return 'break'
+
     def set_verbosity_level(self, level: str):
+        prev_level = self.verbosity_level
         self.verbosity_level = verbosity_levels[level]
+        self.apply_verbosity_filter(prev_level)
 
     def change_verbosity_level(self, event_name: str):
+        prev_level = self.verbosity_level
         if event_name == "up-verbosity-level":
             self.verbosity_level += 1
             if self.verbosity_level == len(verbosity_levels):
@@ -362,19 +1084,52 @@ class LogPrinter():
                 self.verbosity_level = len(verbosity_levels) - 1
         key = [k for k, v in verbosity_levels.items() if v == self.verbosity_level][0]
         self.window['level'].update(value=key)
+        self.apply_verbosity_filter(prev_level)
+
+    def apply_verbosity_filter(self, prev_level: int):
+        # Every line is kept in the history, so the console is re-rendered from it
+        if self.verbosity_level == prev_level:
+            return
+        if self.virtual_console:
+            # Keep the line at the top of the viewport
+            line_nums = self.channel.line_store.view_line_nums(prev_level, self.view_top, self.view_top + 1)
+            line_num = line_nums[0] if len(line_nums) > 0 else self.channel.line_store.end_line
+            self.view_top = self.channel.line_store.view_seq(self.verbosity_level, line_num)
+            self.reset_search_index_to_view()
+            self.viewport_state = None
+            self.viewport_version = self.channel.line_store.version
+            self.render_viewport()
+        else:
+            self.rerender_console()
+        self.find_tags_state = None
 
     def open_new_console(self):
         subprocess.Popen('./obc-debug-console.exe')
 
-    def configure_console(self, font_size: str, tab_len: str, max_console_lines: str):
+    def configure_console(self, font_size: str, tab_len: str, max_console_lines: str, telem_buffer_size: str, overflow_policy: str,
+                          max_history_lines: str, virtual_console: bool, binary_log: bool):
         if font_size.isdecimal():
             self.console_font_size = int(font_size)
             self.window['console'].update(font=(font_style_console, self.console_font_size))
+            self.update_console_line_height()
         if tab_len.isdecimal():
             self.tab_len = int(tab_len)
         if max_console_lines.isdecimal():
             self.max_console_lines = int(max_console_lines)
-        self.update_config(tab_len=self.tab_len, max_console_lines=self.max_console_lines, console_font_size=self.console_font_size)
+        if telem_buffer_size.isdecimal() and int(telem_buffer_size) > 0:
+            self.telem_buffer_size = int(telem_buffer_size)   # Applied when the serial port is opened next time
+        if overflow_policy in OVERFLOW_POLICIES:
+            self.overflow_policy = overflow_policy
+        if max_history_lines.isdecimal() and int(max_history_lines) > 0:
+            self.max_history_lines = int(max_history_lines)
+            for channel in self.channels.values():
+                channel.line_store.max_lines = self.max_history_lines
+        if virtual_console != self.virtual_console:
+            self.set_virtual_console(virtual_console)
+        self.binary_log = binary_log    # Applied when the serial port is opened next time
+        self.update_config(tab_len=self.tab_len, max_console_lines=self.max_console_lines, console_font_size=self.console_font_size,
+                           telem_buffer_size=self.telem_buffer_size, overflow_policy=self.overflow_policy,
+                           max_history_lines=self.max_history_lines, virtual_console=self.virtual_console, binary_log=self.binary_log)
         self.load_config()
 
     def align_tab_string(self, text: str):
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Query and aggregation over many log files, in parallel over all cores
+#   python -m src.log_query log/ archive/2022-12/ --level WARN ERROR FATAL --subsystem WAIT --grep "mode end"
+#   python -m src.log_query "archive/*/log_main_cpu*.csv" --start "2022-12-04 16:00:00" --count subsystem --per minute
+#
+# A CSV log is split into CHUNK_SIZE byte ranges, which are scanned by a pool of processes line by line,
+# so the files can be larger than the memory. The matching rows of a range are sorted and spilled to a
+# temporary file; the files are then merged in timestamp order and streamed to the output.
+# The timestamps are compared as text: "2022-12-04 16:27:58.400256" sorts like the time it stands for.
+
+from __future__ import annotations
+import argparse
+import datetime
+import glob
+import heapq
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+from src.binary_log import BinaryLogReader, format_row, to_timestamp_us
+from src.telemetry import field_tag, verbosity_levels
+
+CHUNK_SIZE = 32 * 1024 * 1024   # bytes of a CSV log scanned by one task
+EDGE_SIZE = 64 * 1024   # bytes read at the end of a file for its last timestamp
+BUCKETS = {'second': 19, 'minute': 16, 'hour': 13, 'day': 10, 'all': 0}    # Length of the timestamp prefix
+level_names = [k for k in verbosity_levels if k != 'NONE']
+
+
+class LogQuery():
+    # Conditions of a row; sent to every worker, so it only holds plain values
+    def __init__(self, start: str = None, end: str = None, levels: list[str] = None, subsystems: list[str] = None,
+                 pattern: str = None, count: str = None, per: str = 'all'):
+        self.start = str(datetime.datetime.fromisoformat(start)) if start else None    # Inclusive
+        self.end = str(datetime.datetime.fromisoformat(end)) if end else None          # Exclusive
+        self.levels = set(levels) if levels else None
+        self.subsystems = set(subsystems) if subsystems else None
+        self.pattern = re.compile(pattern) if pattern else None     # Raise re.error here, not in the workers
+        self.count = count      # None: rows, 'level' or 'subsystem': number of rows per bucket and key
+        self.per = per
+
+    def matcher(self):
+        # line -> (timestamp, level, subsystem) of a matching row, None otherwise.
+        # The subsystem is the tag of the first field, as in the subsystem panel: "ANT_IDX=1\t..." -> "ANT_IDX"
+        start, end, levels, subsystems = self.start, self.end, self.levels, self.subsystems
+        search = self.pattern.search if self.pattern else None
+
+        def match(line: str):
+            items = line.rstrip('\r\n').split(',', 3)
+            if len(items) < 3 or items[1] not in verbosity_levels:
+                return None
+            timestamp, level, subsystem = items[0], items[1], field_tag(items[2])
+            if start is not None and timestamp < start:
+                return None
+            if end is not None and timestamp >= end:
+                return None
+            if levels is not None and level not in levels:
+                return None
+            if subsystems is not None and subsystem not in subsystems:
+                return None
+            if search is not None and (len(items) < 4 or search(items[3]) is None):
+                return None
+            return timestamp, level, subsystem
+        return match
+
+    def overlaps(self, first: str, last: str) -> bool:
+        # Whether rows from first to last (timestamps, None if unknown) can be in the time range
+        if self.start is not None and last is not None and last < self.start:
+            return False
+        if self.end is not None and first is not None and first >= self.end:
+            return False
+        return True
+
+
+def expand_sources(paths: list[str]) -> list[str]:
+    # Files, glob patterns (also on Windows) and directories (their CSV logs, recursively)
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(sorted(glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)))
+        elif glob.has_magic(path):
+            sources.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            sources.append(path)
+    return list(dict.fromkeys(sources))
+
+
+def line_timestamp(line: bytes):
+    idx = line.find(b',')
+    return line[:idx].decode(errors='ignore') if idx > 0 else None
+
+
+def first_timestamp(f, offset: int):
+    # Timestamp of the first complete line at or after offset
+    f.seek(max(offset - 1, 0))
+    if offset > 0:
+        f.readline()
+    for line in f:
+        timestamp = line_timestamp(line)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def last_timestamp(f, size: int):
+    f.seek(max(size - EDGE_SIZE, 0))
+    lines = f.read().splitlines()
+    for line in reversed(lines[1:] if size > EDGE_SIZE else lines):
+        timestamp = line_timestamp(line)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def plan_tasks(sources: list[str], query: LogQuery) -> list[tuple]:
+    # (source, start offset, end offset) of the CSV chunks which can hold rows of the time range.
+    # The logs are written in time order, so a chunk ends before the first row of the next one.
+    tasks = []
+    for source in sources:
+        if source.endswith('.odcb'):
+            tasks.append((source, 0, 0))
+            continue
+        size = os.path.getsize(source)
+        if size == 0:
+            continue
+        with open(source, 'rb') as f:
+            if not query.overlaps(first_timestamp(f, 0), last_timestamp(f, size)):
+                continue
+            offsets = list(range(0, size, CHUNK_SIZE)) + [size]
+            firsts = [first_timestamp(f, offset) for offset in offsets[:-1]] + [None]
+        for i in range(len(offsets) - 1):
+            if query.overlaps(firsts[i], firsts[i + 1]):
+                tasks.append((source, offsets[i], offsets[i + 1]))
+    return tasks
+
+
+def scan_lines(source: str, start: int, end: int, query: LogQuery):
+    # Decoded lines which start in [start, end). A binary log skips the segments out of the time range and levels
+    if source.endswith('.odcb'):
+        start_us = to_timestamp_us(datetime.datetime.fromisoformat(query.start)) if query.start else None
+        end_us = to_timestamp_us(datetime.datetime.fromisoformat(query.end)) if query.end else None
+        levels = {verbosity_levels[level] for level in query.levels} if query.levels else None
+        for row in BinaryLogReader(source).read(start_us, end_us, levels, query.subsystems):
+            yield format_row(row)
+        return
+    with open(source, 'rb') as f:
+        pos = start
+        f.seek(max(start - 1, 0))
+        if start > 0:
+            pos = start - 1 + len(f.readline())
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield line.decode(errors='ignore')
+
+
+def scan_task(args: tuple):
+    # Worker: the rows of one task, sorted and spilled to a file in spill_dir, or their counts
+    query, (source, start, end), spill_dir, i = args
+    match = query.matcher()
+    if query.count is not None:
+        prefix = BUCKETS[query.per]
+        key_index = 1 if query.count == 'level' else 2
+        counts = {}
+        for line in scan_lines(source, start, end, query):
+            row = match(line)
+            if row is not None:
+                key = (row[0][:prefix], row[key_index])
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+    rows = []
+    for line in scan_lines(source, start, end, query):
+        row = match(line)
+        if row is not None:
+            rows.append((row[0], line.rstrip('\r\n')))
+    rows.sort(key=lambda row: row[0])
+    spill_src = os.path.join(spill_dir, f"{i}.csv")
+    with open(spill_src, 'w', encoding='utf-8', newline='\n') as f:
+        f.writelines(f"{line}\n" for _, line in rows)
+    return spill_src
+
+
+class TaskResults():
+    # Results of pool.imap by task index, taken from the pool when they are first needed
+    def __init__(self, results):
+        self.results = results
+        self.done = []
+
+    def __getitem__(self, i: int):
+        while len(self.done) <= i:
+            self.done.append(next(self.results))
+        return self.done[i]
+
+
+def read_spills(results: TaskResults, indexes: list[int]):
+    for i in indexes:
+        with open(results[i], 'r', encoding='utf-8', newline='\n') as f:
+            yield from f
+
+
+def label(stream, name: str):
+    for line in stream:
+        yield f"{name},{line}"
+
+
+def run_query(sources: list[str], query: LogQuery, jobs: int = None, out=sys.stdout, with_source: bool = False) -> int:
+    # Rows or counts written to out; returns their number.
+    # The rows are written while the later chunks are still scanned
+    tasks = plan_tasks(sources, query)
+    spill_dir = tempfile.mkdtemp(prefix='odc_query_')
+    try:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.imap(scan_task, [(query, task, spill_dir, i) for i, task in enumerate(tasks)], chunksize=1)
+            if query.count is not None:
+                counts = {}
+                for result in results:
+                    for key, n in result.items():
+                        counts[key] = counts.get(key, 0) + n
+                for (bucket, key), n in sorted(counts.items()):
+                    out.write(f"{bucket},{key},{n}\n" if bucket else f"{key},{n}\n")
+                return len(counts)
+            # The chunks of a log follow each other in time: one stream per log, merged by timestamp
+            results = TaskResults(results)
+            streams = []
+            for source, source_tasks in itertools.groupby(enumerate(tasks), key=lambda item: item[1][0]):
+                stream = read_spills(results, [i for i, _ in source_tasks])
+                streams.append(label(stream, os.path.basename(source)) if with_source else stream)
+            key = (lambda line: line.split(',', 2)[1]) if with_source else (lambda line: line[:line.find(',')])
+            n_rows = 0
+            for line in heapq.merge(*streams, key=key):
+                out.write(line)
+                n_rows += 1
+            return n_rows
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='Search and count the rows of many log files in parallel')
+    parser.add_argument('src', nargs='+', help='log files (.csv, .odcb), glob patterns or directories')
+    parser.add_argument('--start', help='e.g. "2022-12-04 16:30:00"')
+    parser.add_argument('--end')
+    parser.add_argument('--level', nargs='+', choices=level_names)
+    parser.add_argument('--subsystem', nargs='+', help='first field, e.g. WAIT MDR')
+    parser.add_argument('--grep', help='regular expression searched in the message (the fields after the subsystem)')
+    parser.add_argument('--count', choices=['level', 'subsystem'], help='print the number of rows instead of the rows')
+    parser.add_argument('--per', choices=list(BUCKETS.keys()), default='all', help='time bucket of --count')
+    parser.add_argument('--with-source', action='store_true', help='prefix the rows with the name of their log file')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: the number of cores)')
+    parser.add_argument('--output', default=None, help='file to write to (default: stdout)')
+    args = parser.parse_args()
+
+    try:
+        query = LogQuery(args.start, args.end, args.level, args.subsystem, args.grep, args.count, args.per)
+    except re.error as e:
+        parser.error(f"invalid --grep: {e}")
+    except ValueError as e:
+        parser.error(f"invalid --start or --end: {e}")
+    sources = expand_sources(args.src)
+    missing = [source for source in sources if not os.path.isfile(source)]
+    if len(missing) > 0:
+        parser.error(f"no such file: {', '.join(missing)}")
+    out = open(args.output, 'w', encoding='utf-8', newline='\n') if args.output else sys.stdout
+    try:
+        n = run_query(sources, query, args.jobs, out, args.with_source)
+    except BrokenPipeError:     # | head
+        sys.stderr.close()
+        sys.exit(0)
+    finally:
+        if args.output:
+            out.close()
+    print(f"{n} {'counts' if args.count else 'rows'} from {len(sources)} files", file=sys.stderr)
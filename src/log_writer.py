@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from src.binary_log import BinaryLogWriter, binary_log_src
+from src.metrics import metrics
+from src.telemetry import level_names
+
+_STOP = object()
+
+
+def format_rows(telems: list) -> str:
+    # "2022-12-04 16:27:58.400256,INFO,..." The date and time are formatted once per second of the batch
+    rows = []
+    prev_second = None
+    prefix = ''
+    for telem in telems:
+        second, us = divmod(round(telem.timestamp * 1e6), 1000000)
+        if second != prev_second:
+            prev_second = second
+            prefix = f"{datetime.datetime.fromtimestamp(second):%Y-%m-%d %H:%M:%S}."
+        rows.append(f"{prefix}{us:06d},{level_names[telem.level]},{','.join(telem.fields)}\n")
+    return "".join(rows)
+
+
+class LogWriter(threading.Thread):
+    # Writes the telemetry CSV on its own thread, keeping the file open and batching the rows
+    def __init__(self, log_src: str, cpu: str = '', flush_interval: float = 1.0, flush_size: int = 64 * 1024,
+                 rotate_size: int = 0, rotate_interval: float = 0, binary_log: bool = False):
+        super().__init__(daemon=True)
+        self.log_src = log_src
+        self.cpu = cpu
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.rotate_size = rotate_size  # bytes, 0: disabled
+        self.rotate_interval = rotate_interval  # sec, 0: disabled
+        self.binary = BinaryLogWriter(binary_log_src(log_src)) if binary_log else None   # Second sink beside the CSV
+        self.queue = queue.Queue()
+        self.file = None
+        self.file_size = 0
+        self.opened_time = 0
+
+    def write_batch(self, telems: list):
+        if len(telems) > 0:
+            self.queue.put(telems)
+
+    def stop(self, timeout: float = 5.0):
+        self.queue.put(_STOP)
+        self.join(timeout)
+
+    def run(self):
+        chunks = []
+        pending_size = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=max(self.flush_interval - (time.monotonic() - last_flush), 0))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                rows = format_rows(item)
+                self.write_binary(item)
+                chunks.append(rows)
+                pending_size += len(rows)
+            if pending_size >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush(chunks)
+                chunks = []
+                pending_size = 0
+                last_flush = time.monotonic()
+
+        # Drain the rows queued before the stop request
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                chunks.append(format_rows(item))
+                self.write_binary(item)
+        self.flush(chunks)
+        self.close_file()
+        if self.binary is not None:
+            try:
+                self.binary.close()
+            except Exception as e:
+                logging.error(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:{e}')
+
+    def write_binary(self, telems: list):
+        if self.binary is None:
+            return
+        try:
+            self.binary.write_batch(telems)
+        except Exception as e:
+            logging.error(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:{e}')
+
+    def flush(self, chunks: list[str]):
+        if self.binary is not None:
+            try:
+                self.binary.flush()
+            except Exception as e:
+                logging.error(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:{e}')
+        if len(chunks) == 0:
+            return
+        try:
+            if self.file is None:
+                self.open_file()
+            elif self.need_rotation():
+                self.rotate()
+            start = time.perf_counter()
+            data = "".join(chunks)
+            self.file.write(data)
+            self.file.flush()
+            self.file_size += len(data)
+            if metrics.enabled:
+                metrics.record('write', time.perf_counter() - start, data.count('\n'))
+        except Exception as e:
+            logging.error(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:{e}')
+
+    def open_file(self):
+        log_dir = os.path.dirname(self.log_src)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        self.file = open(self.log_src, 'a')
+        self.file_size = self.file.tell()
+        self.opened_time = time.monotonic()
+
+    def close_file(self):
+        if self.file is None:
+            return
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        except Exception as e:
+            logging.error(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:{e}')
+        self.file = None
+
+    def need_rotation(self) -> bool:
+        if self.rotate_size > 0 and self.file_size >= self.rotate_size:
+            return True
+        if self.rotate_interval > 0 and time.monotonic() - self.opened_time >= self.rotate_interval:
+            return True
+        return False
+
+    def rotate(self):
+        # log_main_cpu.csv -> log_main_cpu_20221204-162757.csv
+        self.close_file()
+        root, ext = os.path.splitext(self.log_src)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        rotated_src = f"{root}_{stamp}{ext}"
+        i = 1
+        while os.path.exists(rotated_src):
+            rotated_src = f"{root}_{stamp}_{i}{ext}"
+            i += 1
+        os.replace(self.log_src, rotated_src)
+        logging.info(f'{datetime.datetime.now()}:LogWriter:{self.cpu}:rotated to {rotated_src}')
+        self.open_file()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import threading
+import time
+
+STAGES = ['read', 'parse', 'enqueue', 'queue', 'render', 'write']
+N_BUCKETS = 32      # Bucket i counts the durations in [2^(i-1), 2^i) us
+ROLLING_WINDOW = 10.0   # sec, the stats cover the current and the previous window
+
+
+class StageStats():
+    def __init__(self):
+        self.hist = [0] * N_BUCKETS
+        self.prev_hist = [0] * N_BUCKETS
+        self.items = 0      # Lines (bytes for 'read') in the current window
+        self.prev_items = 0
+
+    def rotate(self):
+        self.prev_hist = self.hist
+        self.prev_items = self.items
+        self.hist = [0] * N_BUCKETS
+        self.items = 0
+
+    def percentile(self, p: float) -> float:
+        # Upper bound of the bucket, in seconds
+        hist = [a + b for a, b in zip(self.hist, self.prev_hist)]
+        total = sum(hist)
+        if total == 0:
+            return 0
+        rank = total * p / 100
+        n = 0
+        for i, count in enumerate(hist):
+            n += count
+            if n >= rank:
+                return (1 << i) / 1e6
+        return (1 << (N_BUCKETS - 1)) / 1e6
+
+
+class Metrics():
+    # Durations of the pipeline stages in rolling log2 histograms, plus item rates.
+    # Callers check self.enabled before taking any timestamp, so it costs one attribute read when off.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {stage: StageStats() for stage in STAGES}
+            self.window_start = time.monotonic()
+            self.prev_window = 0
+
+    def enable(self, enabled: bool):
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def record(self, stage: str, seconds: float, items: int = 1):
+        bucket = min(int(seconds * 1e6).bit_length(), N_BUCKETS - 1) if seconds > 0 else 0
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= ROLLING_WINDOW:
+                for stats in self.stages.values():
+                    stats.rotate()
+                self.prev_window = now - self.window_start
+                self.window_start = now
+            stats = self.stages[stage]
+            stats.hist[bucket] += 1
+            stats.items += items
+
+    def summary(self) -> dict:
+        with self.lock:
+            elapsed = max(time.monotonic() - self.window_start + self.prev_window, 1e-9)
+            return {stage: {
+                'rate': (stats.items + stats.prev_items) / elapsed,
+                'p50': stats.percentile(50),
+                'p99': stats.percentile(99),
+            } for stage, stats in self.stages.items()}
+
+    def format(self) -> str:
+        lines = []
+        for stage, s in self.summary().items():
+            unit = 'B/s' if stage == 'read' else 'lines/s'
+            lines.append(f"{stage:8s}{s['rate']:10.0f} {unit:8s}p50 {s['p50'] * 1000:8.3f} ms   p99 {s['p99'] * 1000:8.3f} ms")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
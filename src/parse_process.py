@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# 'process' reader mode: the serial port is read and parsed in a child process, so the regex matching and
+# field splitting do not compete with Tk for the GIL. The parsed batches come back through a ring buffer
+# in shared memory; the GUI process only rebuilds the Telemetry objects.
+
+from __future__ import annotations
+import datetime
+import logging
+import marshal
+import multiprocessing
+import struct
+import threading
+from multiprocessing import shared_memory
+import serial
+from src.serial_reader import SerialReader
+from src.telemetry import Telemetry, clock_anchor, set_clock_anchor
+
+RING_SIZE = 16 * 1024 * 1024    # bytes
+RING_HEADER = struct.Struct('<QQQ')     # write offset, read offset (both only grow), lines dropped by a full ring
+RECORD_HEADER = struct.Struct('<I')     # payload size
+WRAP = 0xFFFFFFFF   # The rest of the ring is unused, the next record is at the start
+READ_TIMEOUT = 0.1  # sec, how often the child checks for stop
+DRAIN_TIMEOUT = 0.5     # sec, how often an idle drain thread checks that the child is alive
+OPEN_TIMEOUT = 10.0     # sec to wait for the child to open the port
+
+
+def encode_batch(telems: list) -> bytes:
+    # A batch is (timestamps, levels, fields) in columns: one list per attribute instead of a tuple per line
+    return marshal.dumps(([telem.timestamp for telem in telems], bytes([telem.level for telem in telems]), [telem.fields for telem in telems]))
+
+
+def decode_batch(data: bytes) -> list:
+    timestamps, levels, fields = marshal.loads(data)
+    return [Telemetry(level, timestamp, f) for timestamp, level, f in zip(timestamps, levels, fields)]
+
+
+class SharedRing():
+    # Ring of variable-size records in shared memory, for one producer and one consumer.
+    # Each side only writes its own offset, after the record itself is written or read.
+    def __init__(self, name: str = None, size: int = RING_SIZE):
+        self.size = size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=RING_HEADER.size + size)
+            RING_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)     # Only the creator unlinks it
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+
+    def offsets(self) -> tuple[int, int, int]:
+        return RING_HEADER.unpack_from(self.buf, 0)
+
+    def put(self, data: bytes) -> bool:
+        # False if the ring is full
+        n = RECORD_HEADER.size + len(data)
+        write, read, _ = self.offsets()
+        pos = write % self.size
+        skip = self.size - pos if self.size - pos < n else 0
+        if self.size - (write - read) < skip + n:
+            return False
+        if skip >= RECORD_HEADER.size:
+            RECORD_HEADER.pack_into(self.buf, RING_HEADER.size + pos, WRAP)
+        if skip > 0:
+            write += skip
+            pos = 0
+        start = RING_HEADER.size + pos
+        RECORD_HEADER.pack_into(self.buf, start, len(data))
+        self.buf[start + RECORD_HEADER.size:start + n] = data
+        struct.pack_into('<Q', self.buf, 0, write + n)
+        return True
+
+    def get(self):
+        # The oldest record, or None if the ring is empty
+        write, read, _ = self.offsets()
+        if read == write:
+            return None
+        pos = read % self.size
+        if self.size - pos < RECORD_HEADER.size or RECORD_HEADER.unpack_from(self.buf, RING_HEADER.size + pos)[0] == WRAP:
+            read += self.size - pos
+            pos = 0
+        start = RING_HEADER.size + pos
+        length = RECORD_HEADER.unpack_from(self.buf, start)[0]
+        data = bytes(self.buf[start + RECORD_HEADER.size:start + RECORD_HEADER.size + length])
+        struct.pack_into('<Q', self.buf, 8, read + RECORD_HEADER.size + length)
+        return data
+
+    def add_dropped(self, n: int):
+        struct.pack_into('<Q', self.buf, 16, self.offsets()[2] + n)
+
+    @property
+    def dropped(self) -> int:
+        return self.offsets()[2]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def run_reader(port: str, baudrate: int, chunk_size: int, verbosity_level: int, interpolate: bool, ring_name: str, ring_size: int, anchor: tuple,
+               stop, data_ready, conn):
+    # Child process: serial port -> parse -> ring, setting data_ready after every batch
+    set_clock_anchor(anchor)
+    try:
+        serial_port = serial.serial_for_url(port, baudrate, timeout=READ_TIMEOUT)
+    except (serial.SerialException, ValueError) as e:
+        conn.send(str(e))
+        return
+    conn.send(None)
+    ring = SharedRing(ring_name, ring_size)
+    reader = SerialReader(serial_port, 'chunked', chunk_size, interpolate)
+    reader.verbosity_level = verbosity_level
+    try:
+        while not stop.is_set():
+            telems = reader.read()
+            if len(telems) == 0:
+                continue
+            if ring.put(encode_batch(telems)):
+                data_ready.set()
+            else:
+                ring.add_dropped(len(telems))
+    except Exception as e:     # The port was unplugged
+        logging.error(f'{datetime.datetime.now()}:run_reader:{port}:{e}')
+    finally:
+        serial_port.close()
+        ring.close()
+
+
+class ParseProcess():
+    # Reads and parses one serial port in a child process and calls on_telems(name, telems) with the batches,
+    # and on_dropped(name, n) with the number of lines the child dropped because the ring was full
+    def __init__(self, name: str, port: str, baudrate: int, on_telems, chunk_size: int = 65536, verbosity_level: int = 0, interpolate: bool = True,
+                 on_dropped=None):
+        # Raise serial.SerialException if the port cannot be opened
+        self.name = name
+        self.on_telems = on_telems
+        self.on_dropped = on_dropped
+        self.dropped = 0        # Lines dropped by the child, as reported to on_dropped
+        self.ring = SharedRing()
+        self.stop_event = multiprocessing.Event()
+        self.data_ready = multiprocessing.Event()
+        conn, child_conn = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=run_reader,
+            args=(port, baudrate, chunk_size, verbosity_level, interpolate, self.ring.name, self.ring.size, clock_anchor(), self.stop_event, self.data_ready, child_conn),
+            daemon=True,
+        )
+        self.process.start()
+        error = conn.recv() if conn.poll(OPEN_TIMEOUT) else f'{port}: the reader process did not start'
+        conn.close()
+        if error is not None:
+            self.process.join(1.0)
+            self.release()
+            raise serial.SerialException(error)
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        # Until the child has ended and the ring is empty. data_ready is cleared before the ring is emptied,
+        # so a batch put after the last get() still wakes the wait.
+        # The ring is released here, not by stop(): on_telems may still be delivering a batch when stop() gives up waiting
+        try:
+            while True:
+                self.data_ready.clear()
+                data = self.ring.get()
+                while data is not None:
+                    self.on_telems(self.name, decode_batch(data))
+                    data = self.ring.get()
+                self.report_dropped()
+                if not self.process.is_alive():
+                    if self.ring.offsets()[0] == self.ring.offsets()[1]:
+                        break
+                    continue
+                self.data_ready.wait(DRAIN_TIMEOUT)
+        finally:
+            self.release()
+
+    def report_dropped(self):
+        dropped = self.ring.dropped
+        if dropped > self.dropped and self.on_dropped is not None:
+            self.on_dropped(self.name, dropped - self.dropped)
+        self.dropped = dropped
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join(2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        self.data_ready.set()
+        self.thread.join(1.0)
+
+    def release(self):
+        self.ring.close()
+        self.ring.unlink()
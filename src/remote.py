@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# coding:utf-8
+# Sharing the decoded telemetries of a capturing console with the consoles of other engineers.
+# A viewer connects over TCP and sends the name of a CPU ("Main CPU\n"), then receives its lines as
+#   "<POSIX timestamp>,<level>,<fields>\n"
+
+from __future__ import annotations
+import datetime
+import logging
+import queue
+import socket
+import threading
+from src.serial_reader import LineFramer
+from src.telemetry import Telemetry, level_names, make_fields, verbosity_levels
+
+DEFAULT_SHARE_PORT = 50600
+CLIENT_QUEUE_SIZE = 1024    # Batches; a viewer which falls this far behind is dropped
+ACCEPT_TIMEOUT = 0.5    # sec, how often the server checks for stop()
+SUBSCRIBE_TIMEOUT = 5.0
+SEND_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 3.0
+RECV_TIMEOUT = 0.5
+RECV_SIZE = 65536
+
+
+def format_wire(telems: list) -> bytes:
+    return "".join([f"{telem.timestamp:.6f},{level_names[telem.level]},{','.join(telem.fields)}\n" for telem in telems]).encode()
+
+
+def parse_wire(block: str) -> list:
+    telems = []
+    for line in block.splitlines():
+        items = line.split(',')
+        if len(items) < 2 or items[1] not in verbosity_levels:
+            continue
+        try:
+            timestamp = float(items[0])
+        except ValueError:
+            continue
+        telems.append(Telemetry(verbosity_levels[items[1]], timestamp, make_fields([s for s in items[2:] if s])))
+    return telems
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    # "192.168.0.10:50600", "192.168.0.10" or "50600" -> (host, port)
+    host, _, port = address.strip().rpartition(':')
+    if not host:
+        if port.isdigit():
+            return 'localhost', int(port)
+        return port, DEFAULT_SHARE_PORT
+    return host, int(port)
+
+
+class ClientConnection(threading.Thread):
+    # Sends the batches queued by TelemServer.publish() to one viewer
+    def __init__(self, server: TelemServer, sock: socket.socket, address: tuple):
+        super().__init__(daemon=True)
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.cpu = None
+        self.queue = queue.Queue(server.queue_size)
+        self.closed = False
+
+    def send(self, data: bytes) -> bool:
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        # Unblocks a sendall() stuck on a viewer which stopped reading
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def run(self):
+        try:
+            self.cpu = self.read_subscription()
+            self.server.subscribe(self)
+            self.sock.settimeout(SEND_TIMEOUT)
+            while not self.closed:
+                try:
+                    data = self.queue.get(timeout=ACCEPT_TIMEOUT)
+                except queue.Empty:
+                    continue
+                self.sock.sendall(data)
+        except (OSError, ValueError) as e:
+            if not self.closed:
+                logging.info(f'{datetime.datetime.now()}:ClientConnection:{self.address}:{e}')
+        finally:
+            self.server.unsubscribe(self)
+            self.sock.close()
+
+    def read_subscription(self) -> str:
+        self.sock.settimeout(SUBSCRIBE_TIMEOUT)
+        line = b''
+        while not line.endswith(b'\n'):
+            data = self.sock.recv(256)
+            if not data or len(line) > 256:
+                raise ValueError('no subscription')
+            line += data
+        return line.decode(errors='ignore').strip()
+
+
+class TelemServer(threading.Thread):
+    # Republishes the telemetries read by this process to the viewers on the network.
+    # publish() is called on the reader thread: it formats a batch once and only queues it,
+    # so a slow viewer is dropped instead of stalling the serial ports.
+    def __init__(self, host: str = '0.0.0.0', port: int = DEFAULT_SHARE_PORT, queue_size: int = CLIENT_QUEUE_SIZE):
+        super().__init__(daemon=True)
+        self.sock = socket.create_server((host, port))
+        self.sock.settimeout(ACCEPT_TIMEOUT)
+        self.port = self.sock.getsockname()[1]
+        self.queue_size = queue_size
+        self.subscribers = {}   # CPU -> tuple of clients, replaced on every change so publish() needs no lock
+        self.dropped_clients = 0
+        self.lock = threading.Lock()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                sock, address = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            ClientConnection(self, sock, address).start()
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            clients = [client for clients in self.subscribers.values() for client in clients]
+        for client in clients:
+            client.close()
+        if self.is_alive():
+            self.join(1.0)
+
+    def publish(self, cpu: str, telems: list):
+        clients = self.subscribers.get(cpu)
+        if not clients:
+            return
+        data = format_wire(telems)
+        for client in clients:
+            if not client.send(data):
+                logging.warning(f'{datetime.datetime.now()}:TelemServer:{cpu}:{client.address} is too slow, dropped')
+                self.dropped_clients += 1
+                self.unsubscribe(client)
+                client.close()
+
+    def subscribe(self, client: ClientConnection):
+        with self.lock:
+            self.subscribers[client.cpu] = self.subscribers.get(client.cpu, ()) + (client,)
+
+    def unsubscribe(self, client: ClientConnection):
+        with self.lock:
+            clients = self.subscribers.get(client.cpu, ())
+            if client in clients:
+                self.subscribers[client.cpu] = tuple(c for c in clients if c is not client)
+
+    def n_clients(self) -> int:
+        return sum(len(clients) for clients in self.subscribers.values())
+
+
+class RemoteSource(threading.Thread):
+    # Feeds a buffer with the telemetries of one CPU published by the TelemServer of another console
+    def __init__(self, address: str, cpu: str, buffer, on_telems=None):
+        # Raise OSError or ValueError if the server cannot be reached
+        super().__init__(daemon=True)
+        self.address = address
+        self.cpu = cpu
+        self.buffer = buffer
+        self.on_telems = on_telems  # Called with every batch put into the buffer
+        self.sock = socket.create_connection(parse_address(address), timeout=CONNECT_TIMEOUT)
+        self.sock.sendall(f"{cpu}\n".encode())
+        self.sock.settimeout(RECV_TIMEOUT)
+        self.framer = LineFramer()
+        self.error = None
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                self.error = str(e)
+                break
+            if not data:
+                self.error = 'Closed by the server'
+                break
+            block = self.framer.feed(data)
+            if len(block) > 0:
+                telems = parse_wire(block.decode(errors='ignore'))
+                if len(telems) > 0:
+                    if self.on_telems is not None:
+                        self.on_telems(telems)
+                    self.buffer.put_batch(telems)
+        if self.error is not None and self.running:
+            logging.error(f'{datetime.datetime.now()}:RemoteSource:{self.cpu}:{self.address}:{self.error}')
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1.0)
+        self.sock.close()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import bisect
+import datetime
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from src.telemetry import Telemetry, make_fields, verbosity_levels
+
+INDEX_STRIDE = 256 * 1024   # bytes between the entries of the timestamp index
+INDEX_MAGIC = b'ODCIDX01'
+INDEX_HEADER = struct.Struct('<8sqdq')  # magic, file size, mtime, number of entries
+READ_BLOCK_SIZE = 64 * 1024
+MAX_EMIT_LINES = 2000   # Lines put into the buffer at once
+MAX_REPLAY_GAP = 10.0   # sec, longer silences in the log are skipped
+REPLAY_SPEEDS = {'1x': 1.0, '2x': 2.0, '5x': 5.0, '10x': 10.0, '100x': 100.0, 'Max': 0}
+
+
+def parse_log_line(line: str):
+    # "2022-12-04 16:27:58.400256,INFO,WAIT,Wait mode end -> WAIT_MODE" -> Telemetry
+    items = line.rstrip('\r\n').split(',')
+    if len(items) < 2 or items[1] not in verbosity_levels:
+        return None
+    try:
+        timestamp = datetime.datetime.fromisoformat(items[0]).timestamp()
+    except ValueError:
+        return None
+    return Telemetry(verbosity_levels[items[1]], timestamp, make_fields([s for s in items[2:] if s]))
+
+
+def parse_timestamp(line: bytes):
+    try:
+        return datetime.datetime.fromisoformat(line[:line.find(b',')].decode()).timestamp()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class ReplayIndex():
+    # Sparse timestamp -> byte offset index of a log file.
+    # One entry per INDEX_STRIDE bytes, so building it only touches a few bytes of every stride
+    # and a seek scans at most one stride. Cached next to the log file as <log_src>.idx.
+    def __init__(self, log_src: str, mm: mmap.mmap):
+        self.log_src = log_src
+        self.idx_src = f"{log_src}.idx"
+        self.mm = mm
+        self.timestamps = array('d')
+        self.offsets = array('q')
+        stat = os.stat(log_src)
+        if not self.load(stat.st_size, stat.st_mtime):
+            self.build()
+            self.save(stat.st_size, stat.st_mtime)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def first_timestamp(self) -> float:
+        return self.timestamps[0] if len(self) > 0 else 0
+
+    @property
+    def last_timestamp(self) -> float:
+        # Timestamp of the last complete line
+        mm = self.mm
+        end = mm.rfind(b'\n', 0, len(mm))
+        while end > 0:
+            start = mm.rfind(b'\n', 0, end) + 1
+            timestamp = parse_timestamp(mm[start:end])
+            if timestamp is not None:
+                return timestamp
+            end = start - 1
+        return self.first_timestamp
+
+    def build(self):
+        mm = self.mm
+        pos = 0
+        while pos < len(mm):
+            end = mm.find(b'\n', pos)
+            if end < 0:
+                break
+            timestamp = parse_timestamp(mm[pos:end])
+            if timestamp is not None and (len(self) == 0 or timestamp >= self.timestamps[-1]):
+                self.timestamps.append(timestamp)
+                self.offsets.append(pos)
+                # Next entry: the first line starting after one stride
+                end = mm.find(b'\n', pos + INDEX_STRIDE)
+                if end < 0:
+                    break
+            pos = end + 1
+
+    def load(self, file_size: int, mtime: float) -> bool:
+        try:
+            with open(self.idx_src, 'rb') as f:
+                magic, size, cached_mtime, n = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or size != file_size or cached_mtime != mtime:
+                    return False
+                self.timestamps.fromfile(f, n)
+                self.offsets.fromfile(f, n)
+            return True
+        except (OSError, EOFError, struct.error):
+            self.timestamps = array('d')
+            self.offsets = array('q')
+            return False
+
+    def save(self, file_size: int, mtime: float):
+        try:
+            with open(self.idx_src, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, file_size, mtime, len(self)))
+                self.timestamps.tofile(f)
+                self.offsets.tofile(f)
+        except OSError as e:
+            logging.error(f'{datetime.datetime.now()}:ReplayIndex:{self.idx_src}:{e}')
+
+    def offset_of(self, timestamp: float) -> int:
+        # Offset of the first line at or after timestamp
+        i = bisect.bisect_right(self.timestamps, timestamp) - 1
+        if i < 0:
+            return 0
+        pos = self.offsets[i]
+        mm = self.mm
+        while pos < len(mm):
+            end = mm.find(b'\n', pos)
+            if end < 0:
+                return len(mm)
+            line_timestamp = parse_timestamp(mm[pos:end])
+            if line_timestamp is not None and line_timestamp >= timestamp:
+                return pos
+            pos = end + 1
+        return len(mm)
+
+
+class ReplaySource(threading.Thread):
+    # Streams a recorded log file into a TelemRingBuffer, like the serial reader does.
+    # speed: 1.0 is real time, 0 is as fast as the buffer is drained
+    def __init__(self, log_src: str, buffer, speed: float = 1.0, on_telems=None):
+        super().__init__(daemon=True)
+        self.log_src = log_src
+        self.buffer = buffer
+        self.speed = speed
+        self.on_telems = on_telems  # Called with every batch put into the buffer
+        self.file = open(log_src, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = ReplayIndex(log_src, self.mm)
+        self.first_timestamp = self.index.first_timestamp
+        self.last_timestamp = self.index.last_timestamp
+        self.offset = 0
+        self.pending = []       # Parsed lines not put into the buffer yet
+        self.position = self.first_timestamp    # Timestamp of the last replayed line
+        self.paused = False
+        self.running = True
+        self.anchor = None      # (wall clock, log timestamp) the pacing is measured from
+        self.lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.offset >= len(self.mm) and len(self.pending) == 0
+
+    def seek(self, timestamp: float):
+        # The lines before the seek which are still in the buffer are discarded
+        with self.lock:
+            self.offset = self.index.offset_of(timestamp)
+            self.position = timestamp
+            self.pending = []
+            self.anchor = None
+            self.buffer.get_batch(len(self.buffer))
+
+    def set_speed(self, speed: float):
+        with self.lock:
+            self.speed = speed
+            self.anchor = None
+
+    def pause(self, paused: bool):
+        with self.lock:
+            self.paused = paused
+            self.anchor = None
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1.0)
+        self.mm.close()
+        self.file.close()
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                wait = self.step()
+            if wait > 0:
+                time.sleep(wait)
+
+    def step(self) -> float:
+        # Put the lines which are due into the buffer and return how long to sleep
+        if self.paused or self.finished:
+            return 0.05
+        if len(self.pending) == 0:
+            self.pending = self.read_block()
+            return 0
+        n = self.n_due()
+        if n == 0:
+            return 0.01
+        if len(self.buffer) > 0 and len(self.buffer) + n > self.buffer.capacity:
+            return 0.01     # Wait for the console instead of letting the buffer drop lines
+        telems = self.pending[:n]
+        del self.pending[:n]
+        self.position = telems[-1].timestamp
+        if self.on_telems is not None:
+            self.on_telems(telems)
+        self.buffer.put_batch(telems)
+        return 0
+
+    def read_block(self) -> list:
+        mm = self.mm
+        end = mm.rfind(b'\n', self.offset, min(self.offset + READ_BLOCK_SIZE, len(mm)))
+        if end < 0:
+            end = mm.find(b'\n', self.offset)   # A line longer than READ_BLOCK_SIZE
+            if end < 0:
+                self.offset = len(mm)   # The last line is not complete yet
+                return []
+        block = mm[self.offset:end + 1].decode(errors='ignore')
+        self.offset = end + 1
+        return [telem for telem in map(parse_log_line, block.splitlines()) if telem is not None]
+
+    def n_due(self) -> int:
+        # Number of pending lines whose time has come
+        if self.speed <= 0:
+            return min(len(self.pending), MAX_EMIT_LINES)
+        now = time.monotonic()
+        if self.anchor is None:
+            self.anchor = (now, self.pending[0].timestamp)
+        due = self.anchor[1] + (now - self.anchor[0]) * self.speed
+        n = 0
+        while n < len(self.pending) and n < MAX_EMIT_LINES and self.pending[n].timestamp <= due:
+            n += 1
+        if n == 0 and self.pending[0].timestamp - due > MAX_REPLAY_GAP:
+            self.anchor = None
+        return n
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import bisect
+import re
+from src.line_store import COMPACT_MIN_LINES
+
+
+class SearchIndex():
+    # Mirror of the console lines with the matches of the current query kept up to date.
+    # Lines are numbered from the start of the session, so trimming does not renumber the matches.
+    # Like LineStore, trimming only moves the start indexes and the lists are compacted lazily.
+    def __init__(self):
+        self.lines = []
+        self.start = 0          # Index of the first retained line in self.lines
+        self.first_line = 0     # Line number of the first retained line
+        self.pattern = None
+        self.query = None
+        self.matches = []       # Sorted list of (line number, column, length)
+        self.match_start = 0    # Index of the first retained match
+        self.current = None     # Match selected by find_next/find_previous
+
+    def __len__(self):
+        return len(self.lines) - self.start
+
+    @property
+    def n_matches(self) -> int:
+        return len(self.matches) - self.match_start
+
+    def append_lines(self, lines: list[str]):
+        line_num = self.first_line + len(self)
+        self.lines.extend(lines)
+        if self.pattern is not None:
+            for i, line in enumerate(lines):
+                self._match_line(line_num + i, line)
+
+    def set_line(self, line_num: int, line: str):
+        # Rewrite a line (used when a progress bar is redrawn in place)
+        idx = line_num - self.first_line
+        if idx < 0 or idx >= len(self):
+            return
+        self.lines[self.start + idx] = line
+        if self.pattern is None:
+            return
+        lo = bisect.bisect_left(self.matches, (line_num,), self.match_start)
+        hi = bisect.bisect_left(self.matches, (line_num + 1,), lo)
+        self.matches[lo:hi] = self._line_matches(line_num, line)
+
+    def trim(self, n: int):
+        if n <= 0:
+            return
+        self.start = min(self.start + n, len(self.lines))
+        self.first_line += n
+        self.match_start = bisect.bisect_left(self.matches, (self.first_line,), self.match_start)
+        if self.start >= COMPACT_MIN_LINES and self.start * 2 >= len(self.lines):
+            del self.lines[:self.start]
+            self.start = 0
+        if self.match_start >= COMPACT_MIN_LINES and self.match_start * 2 >= len(self.matches):
+            del self.matches[:self.match_start]
+            self.match_start = 0
+
+    def clear(self):
+        self.first_line += len(self)
+        self.lines = []
+        self.start = 0
+        self.matches = []
+        self.match_start = 0
+        self.current = None
+
+    def reset(self, lines: list[str], first_line: int):
+        # Replace the mirrored lines and rescan them with the current query
+        self.lines = list(lines)
+        self.start = 0
+        self.first_line = first_line
+        self.matches = []
+        self.match_start = 0
+        self.current = None
+        if self.pattern is not None:
+            for i, line in enumerate(self.lines):
+                self._match_line(self.first_line + i, line)
+
+    def set_query(self, text: str, regex: bool = False, ignore_case: bool = False) -> bool:
+        # Raise re.error if text is not a valid regular expression
+        query = (text, regex, ignore_case)
+        if query == self.query:
+            return False
+        self.query = query
+        self.matches = []
+        self.match_start = 0
+        self.current = None
+        if len(text) == 0:
+            self.pattern = None
+            return True
+        self.pattern = re.compile(text if regex else re.escape(text), re.IGNORECASE if ignore_case else 0)
+        for i in range(len(self)):
+            self._match_line(self.first_line + i, self.lines[self.start + i])
+        return True
+
+    def find_next(self):
+        n = self.n_matches
+        if n == 0:
+            return None
+        idx = 0 if self.current is None else bisect.bisect_right(self.matches, self.current, self.match_start) - self.match_start
+        self.current = self.matches[self.match_start + idx % n]
+        return self.current
+
+    def find_previous(self):
+        n = self.n_matches
+        if n == 0:
+            return None
+        idx = n if self.current is None else bisect.bisect_left(self.matches, self.current, self.match_start) - self.match_start
+        self.current = self.matches[self.match_start + (idx - 1) % n]
+        return self.current
+
+    def position(self) -> tuple[int, int]:
+        # (index of the current match, number of matches)
+        if self.current is None:
+            return -1, self.n_matches
+        return bisect.bisect_left(self.matches, self.current, self.match_start) - self.match_start, self.n_matches
+
+    def matches_between(self, first_line: int, last_line: int) -> list:
+        lo = bisect.bisect_left(self.matches, (first_line,), self.match_start)
+        hi = bisect.bisect_left(self.matches, (last_line + 1,), lo)
+        return self.matches[lo:hi]
+
+    def _match_line(self, line_num: int, line: str):
+        self.matches.extend(self._line_matches(line_num, line))
+
+    def _line_matches(self, line_num: int, line: str) -> list:
+        return [(line_num, m.start(), m.end() - m.start()) for m in self.pattern.finditer(line) if m.end() > m.start()]
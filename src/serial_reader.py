@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import datetime
+import logging
+import re
+import selectors
+import socket
+import threading
+import time
+import serial
+from src.metrics import metrics
+from src.telemetry import Telemetry, make_fields, session_time, verbosity_levels
+
+reader_modes = ['chunked', 'line']
+pattern_tm = re.compile(r"(DEBUG,|INFO,|WARN,|ERROR,|FATAL,)(.*)\n")
+MAX_PARTIAL_LINE = 64 * 1024    # bytes, a partial line longer than this is discarded
+BITS_PER_BYTE = 10  # 8N1: start bit, 8 data bits, stop bit
+MAX_POLL_INTERVAL = 0.02    # sec, the polling of idle ports without a file descriptor backs off up to this
+
+_level_patterns = {}
+
+
+def level_pattern(verbosity_level: int) -> re.Pattern:
+    # Multi-line pattern which only matches the lines at or above verbosity_level
+    if verbosity_level not in _level_patterns:
+        levels = [k for k, v in verbosity_levels.items() if v >= verbosity_level and k != 'NONE']
+        if len(levels) == 0:
+            _level_patterns[verbosity_level] = re.compile(r"(?!)")
+        else:
+            _level_patterns[verbosity_level] = re.compile(rf"^({'|'.join(levels)}),(.*)$", re.M)
+    return _level_patterns[verbosity_level]
+
+
+def parse_line(str_data: str, verbosity_level: int, timestamp: float = None):
+    re_result = pattern_tm.match(str_data)
+    if re_result:
+        level = re_result.group(1)[:-1]
+        if verbosity_levels[level] >= verbosity_level:
+            line_data = [f"{s}" for s in re_result.group(2).split(",") if s]
+            line_data = [l.replace('\x00', '') for l in line_data]
+            return Telemetry(verbosity_levels[level], timestamp if timestamp is not None else session_time(), make_fields(line_data))
+    return None
+
+
+def parse_block(str_data: str, verbosity_level: int, arrival: float = None, byte_time: float = 0.0, earliest: float = 0.0) -> list:
+    # str_data consists of complete lines, each ending with '\n', and its last byte was read at arrival.
+    # With byte_time (sec per byte on the wire) a line is stamped with the time its '\n' arrived,
+    # counted back from arrival but not before earliest (the previous read); otherwise the lines share arrival.
+    if arrival is None:
+        arrival = session_time()
+    if byte_time <= 0:
+        return [Telemetry(verbosity_levels[m.group(1)], arrival, make_fields([s.replace('\x00', '') for s in m.group(2).split(",") if s]))
+                for m in level_pattern(verbosity_level).finditer(str_data)]
+    end = len(str_data) - 1
+    return [Telemetry(verbosity_levels[m.group(1)], max(arrival - (end - m.end()) * byte_time, earliest),
+                      make_fields([s.replace('\x00', '') for s in m.group(2).split(",") if s]))
+            for m in level_pattern(verbosity_level).finditer(str_data)]
+
+
+class LineFramer():
+    # Splits a byte stream into complete lines, keeping the partial line between reads
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        self.buf += data
+        idx = self.buf.rfind(b'\n')
+        if idx < 0:
+            if len(self.buf) > MAX_PARTIAL_LINE:
+                self.buf.clear()
+            return b''
+        block = bytes(self.buf[:idx + 1])
+        del self.buf[:idx + 1]
+        return block
+
+    def clear(self):
+        self.buf.clear()
+
+
+class SerialReader():
+    def __init__(self, serial_port, mode: str = 'chunked', chunk_size: int = 65536, interpolate: bool = True):
+        self.serial = serial_port
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.verbosity_level = 0
+        self.framer = LineFramer()
+        self.read_bytes = 0
+        # Sec per byte on the wire, only known for a UART opened by serial.Serial. 0 (no interpolation) for
+        # loop://, socket://, rfc2217:// (they report a baudrate too), and when disabled for USB-CDC ports
+        if interpolate and isinstance(serial_port, serial.Serial) and serial_port.baudrate:
+            self.byte_time = BITS_PER_BYTE / serial_port.baudrate
+        else:
+            self.byte_time = 0.0
+        self.last_arrival = 0.0
+
+    def read(self) -> list:
+        if self.mode == 'line':
+            return self.read_line()
+        return self.read_chunk()
+
+    def read_line(self) -> list:
+        byte_data = self.serial.readline()
+        arrival = session_time()
+        self.read_bytes += len(byte_data)
+        telem = parse_line(byte_data.decode(errors='ignore'), self.verbosity_level, arrival)
+        return [telem] if telem is not None else []
+
+    def read_chunk(self) -> list:
+        # Block for the first byte, then take everything the driver already has
+        byte_data = self.serial.read(min(max(self.serial.in_waiting, 1), self.chunk_size))
+        return self.parse(byte_data, session_time())
+
+    def read_available(self) -> list:
+        # Never blocks: only the bytes the driver already has are read
+        n_waiting = self.serial.in_waiting
+        if n_waiting == 0:
+            return []
+        if not metrics.enabled:
+            byte_data = self.serial.read(min(n_waiting, self.chunk_size))
+            return self.parse(byte_data, session_time())
+        start = time.perf_counter()
+        byte_data = self.serial.read(min(n_waiting, self.chunk_size))
+        arrival = session_time()
+        metrics.record('read', time.perf_counter() - start, len(byte_data))
+        return self.parse(byte_data, arrival)
+
+    def parse(self, byte_data: bytes, arrival: float = None) -> list:
+        # arrival: when byte_data was read, taken before decoding and parsing so that a busy console stamps correctly
+        if arrival is None:
+            arrival = session_time()
+        earliest, self.last_arrival = self.last_arrival, arrival
+        self.read_bytes += len(byte_data)
+        partial = len(self.framer.buf)
+        block = self.framer.feed(byte_data)
+        if len(block) == 0:
+            return []
+        # The bytes of the next partial line came after the last '\n' of block
+        block_arrival = max(arrival - (partial + len(byte_data) - len(block)) * self.byte_time, earliest)
+        if not metrics.enabled:
+            return parse_block(block.decode(errors='ignore'), self.verbosity_level, block_arrival, self.byte_time, earliest)
+        start = time.perf_counter()
+        telems = parse_block(block.decode(errors='ignore'), self.verbosity_level, block_arrival, self.byte_time, earliest)
+        metrics.record('parse', time.perf_counter() - start, len(telems))
+        return telems
+
+
+class MultiSerialReader(threading.Thread):
+    # Services the serial ports of several CPUs from one thread.
+    # The ports are waited on with a selector where they have a file descriptor (POSIX),
+    # otherwise (Windows) their in_waiting is polled, every poll_interval while they receive data and
+    # backing off to MAX_POLL_INTERVAL while they are idle.
+    # A socket pair in the selector wakes the thread when the ports change or it is stopped,
+    # so it blocks without a timeout while no port needs polling.
+    # Every port is stamped by the same thread, so the timestamps of the CPUs can be compared.
+    def __init__(self, on_telems, chunk_size: int = 65536, poll_interval: float = 0.005, interpolate: bool = True):
+        super().__init__(daemon=True)
+        self.on_telems = on_telems  # on_telems(name, telems), called on the reader thread
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.idle_interval = poll_interval  # Current interval of the polled ports
+        self.interpolate = interpolate
+        self.readers = {}
+        self.fds = {}
+        self.polled = set()     # Names of the ports which cannot be registered to the selector
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ, None)
+        self.lock = threading.Lock()
+        self.running = True
+
+    def add_port(self, name: str, serial_port):
+        with self.lock:
+            self.readers[name] = SerialReader(serial_port, 'chunked', self.chunk_size, self.interpolate)
+            try:
+                self.selector.register(serial_port.fileno(), selectors.EVENT_READ, name)
+                self.fds[name] = serial_port.fileno()
+            except (AttributeError, OSError, ValueError):
+                self.polled.add(name)
+                self.idle_interval = self.poll_interval
+        self.wake()
+
+    def remove_port(self, name: str, reader: SerialReader = None):
+        # Call before closing the port. If reader is given, the port is removed only if it is still served by it
+        with self.lock:
+            if name not in self.readers or (reader is not None and self.readers[name] is not reader):
+                return
+            del self.readers[name]
+            if name in self.fds:
+                self.selector.unregister(self.fds.pop(name))
+            self.polled.discard(name)
+        self.wake()
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_send.send(b'\0')
+        except OSError:
+            pass    # The socket buffer is full, so a wakeup is already pending
+
+    def run(self):
+        try:
+            self.serve()
+        finally:
+            self.selector.close()
+            self.wakeup_recv.close()
+            self.wakeup_send.close()
+
+    def serve(self):
+        while self.running:
+            for name in self.wait():
+                with self.lock:
+                    reader = self.readers.get(name)
+                if reader is None:
+                    continue
+                try:
+                    telems = reader.read_available()
+                except Exception as e:     # The port was closed or unplugged
+                    logging.error(f'{datetime.datetime.now()}:MultiSerialReader:{name}:{e}')
+                    self.remove_port(name, reader)
+                    continue
+                if len(telems) > 0:
+                    self.on_telems(name, telems)
+
+    def wait(self) -> list[str]:
+        with self.lock:
+            polled = [(name, self.readers[name]) for name in self.polled]
+        ready = []
+        for name, reader in polled:
+            try:
+                if reader.serial.in_waiting > 0:
+                    ready.append(name)
+            except Exception:
+                ready.append(name)  # Let run() report the error
+        if len(ready) > 0:
+            self.idle_interval = self.poll_interval
+            timeout = 0
+        elif len(polled) > 0:
+            timeout = self.idle_interval
+            self.idle_interval = min(self.idle_interval * 2, MAX_POLL_INTERVAL)
+        else:
+            timeout = None
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                self.clear_wakeups()
+            else:
+                ready.append(key.data)
+        return ready
+
+    def clear_wakeups(self):
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except OSError:
+            pass    # BlockingIOError once the pending wakeups are read
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import collections
+import datetime
+import threading
+from src.telemetry import Telemetry, field_tag, level_names, verbosity_levels
+
+WINDOW_SECONDS = 60     # Length of the sliding window, in seconds of telemetry time
+BURST_LEVEL = verbosity_levels['WARN']
+BURST_LINES = 10        # Lines at or above BURST_LEVEL of one subsystem in one second
+MAX_BURSTS = 20
+
+
+def subsystem_tag(telem: Telemetry) -> str:
+    return field_tag(telem.fields[0] if len(telem.fields) > 0 else '')
+
+
+class SubsystemStats():
+    # Lines per subsystem and level over the last second, the last WINDOW_SECONDS seconds and the whole pass,
+    # and the bursts of WARN or above. The counts are bucketed by the second of the telemetry timestamps:
+    # a line costs two dict updates, and the sliding window is moved once per second.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Start of a pass: the port was opened, or a replay started or seeked
+        with self.lock:
+            self.second = None      # Second of the current bucket
+            self.first_second = None
+            self.current = {}       # (subsystem, level) -> lines in the current second
+            self.last = {}          # Lines in the last complete second
+            self.seconds = collections.deque()  # (second, counts) of the complete seconds in the window
+            self.window = {}        # Sum of self.seconds
+            self.total = {}         # Lines since the start of the pass
+            self.bursts = collections.deque(maxlen=MAX_BURSTS)  # [first second, subsystem, highest level, lines, seconds]
+            self.open_bursts = {}   # Subsystem -> the burst it was in during self.burst_second
+            self.burst_second = None
+
+    def add_batch(self, telems: list):
+        with self.lock:
+            for telem in telems:
+                second = int(telem.timestamp)
+                if self.second is None or second > self.second:
+                    self._advance(second)
+                key = (subsystem_tag(telem), telem.level)
+                self.current[key] = self.current.get(key, 0) + 1
+                self.total[key] = self.total.get(key, 0) + 1
+
+    def tick(self, now: float):
+        # Close the seconds in which nothing was received, so the rates of an idle link fall to 0
+        with self.lock:
+            if self.second is not None and int(now) > self.second:
+                self._advance(int(now))
+
+    def _advance(self, second: int):
+        # A line older than the current bucket (stamped before a tick() closed its second) is counted in it;
+        # only reset() starts over, when a replay seeks or another source starts
+        if self.second is None:
+            self.first_second = second
+            self.current, self.last = {}, {}
+            self.seconds.clear()
+            self.window = {}
+            self.open_bursts = {}
+            self.burst_second = None
+            self.second = second
+            return
+        counts = self.current
+        self.seconds.append((self.second, counts))
+        for key, n in counts.items():
+            self.window[key] = self.window.get(key, 0) + n
+        self._update_bursts(counts)
+        self.last = counts if second == self.second + 1 else {}
+        while len(self.seconds) > 0 and self.seconds[0][0] <= second - WINDOW_SECONDS:
+            for key, n in self.seconds.popleft()[1].items():
+                left = self.window[key] - n
+                if left > 0:
+                    self.window[key] = left
+                else:
+                    del self.window[key]
+        self.current = {}
+        self.second = second
+
+    def _update_bursts(self, counts: dict):
+        alerts = {}
+        for (subsystem, level), n in counts.items():
+            if level >= BURST_LEVEL and level < len(level_names) - 1:
+                n_alert, top_level = alerts.get(subsystem, (0, level))
+                alerts[subsystem] = (n_alert + n, max(top_level, level))
+        prev_bursts = self.open_bursts if self.burst_second == self.second - 1 else {}
+        open_bursts = {}
+        for subsystem, (n, level) in alerts.items():
+            if n < BURST_LINES:
+                continue
+            burst = prev_bursts.get(subsystem)
+            if burst is None:
+                burst = [self.second, subsystem, level, 0, 0]
+                self.bursts.append(burst)
+            burst[2] = max(burst[2], level)
+            burst[3] += n
+            burst[4] += 1
+            open_bursts[subsystem] = burst
+        self.open_bursts = open_bursts
+        self.burst_second = self.second
+
+    def summary(self) -> tuple[list, list]:
+        # Rows per subsystem, the busiest first
+        with self.lock:
+            span = max(min(WINDOW_SECONDS, (self.second or 0) - (self.first_second or 0)), 1)
+            rows = {}
+            for name, counts in (('last', self.last), ('window', self.window), ('total', self.total)):
+                for (subsystem, level), n in counts.items():
+                    row = rows.setdefault(subsystem, {'subsystem': subsystem, 'last': 0, 'window': 0, 'total': 0,
+                                                      'window_levels': [0] * len(level_names)})
+                    row[name] += n
+                    if name == 'window':
+                        row['window_levels'][level] += n
+            for row in rows.values():
+                row['rate'] = row['window'] / span
+            bursts = [tuple(burst) for burst in self.bursts]
+        return sorted(rows.values(), key=lambda row: (row['last'], row['rate'], row['total']), reverse=True), bursts
+
+    def format(self, max_rows: int = 15, max_bursts: int = 5) -> str:
+        rows, bursts = self.summary()
+        warn, error, fatal = verbosity_levels['WARN'], verbosity_levels['ERROR'], verbosity_levels['FATAL']
+        lines = [f"{'Subsystem':12s}{'1s':>6s}{'1min/s':>8s}{'pass':>8s}  W/E/F (1min)"]
+        for row in rows[:max_rows]:
+            levels = row['window_levels']
+            lines.append(f"{row['subsystem'][:12]:12s}{row['last']:6d}{row['rate']:8.1f}{row['total']:8d}  {levels[warn]}/{levels[error]}/{levels[fatal]}")
+        if len(rows) > max_rows:
+            lines.append(f"... {len(rows) - max_rows} more")
+        if len(bursts) > 0:
+            lines.append("")
+            lines.append(f"Bursts (>= {BURST_LINES} {level_names[BURST_LEVEL]}+ lines/s)")
+            for first_second, subsystem, level, n, n_seconds in reversed(bursts[-max_bursts:]):
+                lines.append(f"{datetime.datetime.fromtimestamp(first_second):%H:%M:%S} {subsystem[:12]:12s}{level_names[level]:6s}{n:6d} in {n_seconds} s")
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import collections
+import threading
+from src.telemetry import DEBUG, Telemetry, level_names
+
+OVERFLOW_POLICIES = ['block', 'drop_oldest', 'drop_debug']
+
+
+class TelemRingBuffer():
+    # Fixed-capacity FIFO between the reader thread and the GUI thread.
+    # DEBUG and other lines wait in two queues, and their arrival order is kept as alternating run lengths
+    # (runs[0] is of DEBUG lines if first_debug, runs[1] of the other kind, ...). So dropping the oldest
+    # DEBUG line only touches the first two runs: every put is O(1), and get_batch is O(1) per line.
+    def __init__(self, capacity: int, policy: str = 'drop_debug'):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+        self.capacity = max(int(capacity), 1)
+        self.policy = policy
+        self.debug = collections.deque()
+        self.other = collections.deque()
+        self.runs = collections.deque()
+        self.first_debug = False
+        self.size = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.dropped_levels = {}
+        self.high_water = 0
+        self.closed = False
+        self.on_put = None      # Called after every put, outside the lock
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+
+    def __len__(self):
+        return self.size
+
+    def put(self, telem: Telemetry) -> bool:
+        with self.lock:
+            result = self._put(telem)
+        if self.on_put is not None:
+            self.on_put()
+        return result
+
+    def put_batch(self, telems: list):
+        with self.lock:
+            for telem in telems:
+                self._put(telem)
+        if self.on_put is not None:
+            self.on_put()
+
+    def get_batch(self, max_n: int) -> list:
+        with self.lock:
+            n = min(self.size, max_n)
+            if n == 0:
+                return []
+            telems = []
+            while len(telems) < n:
+                k = min(self.runs[0], n - len(telems))
+                popleft = self.debug.popleft if self.first_debug else self.other.popleft
+                telems.extend([popleft() for _ in range(k)])
+                self._consume_first_run(k)
+            self.size -= n
+            self.not_full.notify_all()
+            return telems
+
+    def peek(self):
+        with self.lock:
+            if self.size == 0:
+                return None
+            return self.debug[0] if self.first_debug else self.other[0]
+
+    def count_dropped(self, n: int):
+        # Lines lost before they reached the buffer (the ring of a parse process was full)
+        with self.lock:
+            self.dropped += n
+
+    def close(self):
+        # Release the reader blocked by the 'block' policy
+        with self.lock:
+            self.closed = True
+            self.not_full.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            'size': self.size,
+            'capacity': self.capacity,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'dropped_levels': dict(self.dropped_levels),
+            'high_water': self.high_water,
+        }
+
+    def _put(self, telem: Telemetry) -> bool:
+        if self.size == self.capacity:
+            if self.policy == 'block':
+                while self.size == self.capacity and not self.closed:
+                    self.not_full.wait(0.1)
+                if self.closed:
+                    self._count_drop(telem)
+                    return False
+            elif self.policy == 'drop_debug' and len(self.debug) > 0:
+                self._remove_first_debug()
+            elif self.policy == 'drop_debug' and telem.level == DEBUG:
+                self._count_drop(telem)
+                return False
+            else:
+                self._count_drop((self.debug if self.first_debug else self.other).popleft())
+                self._consume_first_run(1)
+                self.size -= 1
+
+        is_debug = telem.level == DEBUG
+        (self.debug if is_debug else self.other).append(telem)
+        if len(self.runs) == 0:
+            self.runs.append(1)
+            self.first_debug = is_debug
+        elif is_debug == (self.first_debug != (len(self.runs) % 2 == 0)):    # Same kind as the last run
+            self.runs[-1] += 1
+        else:
+            self.runs.append(1)
+        self.size += 1
+        self.enqueued += 1
+        if self.size > self.high_water:
+            self.high_water = self.size
+        return True
+
+    def _consume_first_run(self, n: int):
+        self.runs[0] -= n
+        if self.runs[0] == 0:
+            self.runs.popleft()
+            self.first_debug = not self.first_debug
+
+    def _remove_first_debug(self):
+        # The oldest DEBUG line is in the first run or the second one
+        self._count_drop(self.debug.popleft())
+        self.size -= 1
+        if self.first_debug:
+            self._consume_first_run(1)
+            return
+        self.runs[1] -= 1
+        if self.runs[1] == 0:
+            # The lines around the emptied run are of the same kind: join them
+            del self.runs[1]
+            if len(self.runs) > 1:
+                self.runs[0] += self.runs[1]
+                del self.runs[1]
+
+    def _count_drop(self, telem: Telemetry):
+        self.dropped += 1
+        level = level_names[telem.level]
+        self.dropped_levels[level] = self.dropped_levels.get(level, 0) + 1
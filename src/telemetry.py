@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# coding:utf-8
+
+from __future__ import annotations
+import time
+from sys import intern
+
+verbosity_levels = {'DEBUG': 0, 'INFO': 1, 'WARN': 2, 'ERROR': 3, 'FATAL': 4, 'NONE': 5}
+level_names = list(verbosity_levels.keys())
+DEBUG = verbosity_levels['DEBUG']
+MAX_TAGS = 4096
+_tags = {}
+
+# Session clock: the wall time is read once, then advanced by the monotonic high-resolution counter,
+# so the timestamps of a pass are not moved by NTP or a change of the system time
+_wall_anchor = time.time()
+_perf_anchor = time.perf_counter()
+
+
+class Telemetry():
+    # One line of telemetry. Millions of them can wait in the buffer, so it is kept small:
+    # level code instead of the level name, POSIX timestamp instead of datetime,
+    # tuple of interned fields (subsystems and most messages repeat).
+    # The timestamp is the session_time() at which the '\n' of the line was read.
+    __slots__ = ('level', 'timestamp', 'fields')
+
+    def __init__(self, level: int, timestamp: float, fields: tuple[str, ...]):
+        self.level = level
+        self.timestamp = timestamp
+        self.fields = fields
+
+    @property
+    def level_name(self) -> str:
+        return level_names[self.level]
+
+    def __repr__(self):
+        return f"Telemetry({self.level_name}, {self.timestamp}, {self.fields})"
+
+
+def make_fields(fields: list[str]) -> tuple[str, ...]:
+    return tuple([intern(s) for s in fields])
+
+
+def field_tag(field: str) -> str:
+    # Subsystem of a line, from its first field: "WAIT" -> "WAIT", "ANT_IDX=1\tdeplyed_flag=1..." -> "ANT_IDX"
+    tag = _tags.get(field)
+    if tag is None:
+        tag = field.split('\t', 1)[0].split('=', 1)[0].strip()
+        if len(_tags) < MAX_TAGS:
+            _tags[field] = tag
+    return tag
+
+
+def session_time() -> float:
+    # POSIX timestamp of the session clock
+    return _wall_anchor + (time.perf_counter() - _perf_anchor)
+
+
+def clock_anchor() -> tuple[float, float]:
+    return _wall_anchor, _perf_anchor
+
+
+def set_clock_anchor(anchor: tuple[float, float]):
+    # A child process stamps with the clock of its parent (perf_counter() is system-wide)
+    global _wall_anchor, _perf_anchor
+    _wall_anchor, _perf_anchor = anchor